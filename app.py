@@ -1,26 +1,40 @@
 import asyncio
-from openai import AsyncOpenAI
+import os
+from contextlib import asynccontextmanager
 from uuid import uuid4
 import warnings
 
 import chainlit as cl
 from chainlit.logger import logger
+from chainlit.server import app as chainlit_app
+from starlette.requests import Request
+from starlette.responses import PlainTextResponse
+from starlette.routing import Route
 
 
 from realtime import RealtimeClient
+from realtime.accounting import process_usage
+from realtime.admission import admission
+from realtime.compaction import ConversationCompactor
+from realtime.recording import EventRecorder
+from realtime.sessions import sessions
+from realtime.vad import AdaptiveVAD
 from utils.utils import voice, upload_file_to_images_container, realtime_prompt
 from tools.general_tools import GetCurrentTimeTool
 from tools.general_tools import GetRandomNumberTool
 from tools.general_tools import BingSearchTool
-from tools.file_tools import CreateFileTool, DeleteFileTool, IngestFileTool, UpdateFileTool
+from tools.file_tools import CreateFileTool, DeleteFileTool, IngestFileTool, SearchFilesTool, UpdateFileTool
 from tools.image_tools import GenerateImageTool, DescribeImageTool, ProcessScreenshotsTool
 from tools.memory_tools import AddToMemoryTool, IngestMemoryTool, ResetActiveMemoryTool
 from tools.clipboard_tools import ClipboardToMemoryTool, ClipboardToFileTool
+from utils.message_stream import ThrottledMessageStream
+from utils.metrics import registry
+from utils.llm import close_client, connection_stats
+from utils.llm_cache import opened_cache
+from utils.file_matcher import file_matcher
 
 warnings.filterwarnings("ignore", category=DeprecationWarning)
 
-client = AsyncOpenAI()  
-
 tools = [
     CreateFileTool().get_tool(),  # returns the def and handle
     UpdateFileTool().get_tool(),  # returns the def and handle
@@ -36,14 +50,44 @@ tools = [
     ClipboardToMemoryTool().get_tool(), # returns the def and handle
     ClipboardToFileTool().get_tool(), # returns the def and handle
     ProcessScreenshotsTool().get_tool(), # returns the def and handle
-    IngestFileTool().get_tool() # returns the def and handle
+    IngestFileTool().get_tool(), # returns the def and handle
+    SearchFilesTool().get_tool() # returns the def and handle
 ]  
 
+async def metrics(request: Request):
+    """Text exposition of the in-process metrics registry."""
+    return PlainTextResponse(registry.exposition(), media_type="text/plain; version=0.0.4")
+
+# Chainlit serves its UI from a catch-all route, so ours has to be placed in front of it
+if not any(getattr(route, "path", None) == "/metrics" for route in chainlit_app.router.routes):
+    chainlit_app.router.routes.insert(0, Route("/metrics", metrics, methods=["GET"]))
+
+def close_openai_client_on_shutdown(chainlit_lifespan):
+    """Wraps Chainlit's lifespan so the shared OpenAI client is closed before Chainlit exits the process."""
+    @asynccontextmanager
+    async def lifespan(app):
+        async with chainlit_lifespan(app) as state:
+            try:
+                yield state
+            finally:
+                logger.info(f"OpenAI client connections: {connection_stats()}")
+                if opened_cache():
+                    logger.info(f"LLM response cache: {opened_cache().stats()}")
+                logger.info(f"Local file matches: {file_matcher.stats()}")
+                await close_client()
+    lifespan.closes_openai_client = True
+    return lifespan
+
+if not getattr(chainlit_app.router.lifespan_context, "closes_openai_client", False):
+    chainlit_app.router.lifespan_context = close_openai_client_on_shutdown(chainlit_app.router.lifespan_context)
+
 async def setup_openai_realtime():
     """Instantiate and configure the OpenAI Realtime Client"""
     openai_realtime = RealtimeClient()
     await openai_realtime.update_session(instructions=realtime_prompt, voice=voice) # set the instructions
     cl.user_session.set("track_id", str(uuid4()))
+    cl.user_session.set("message_streams", {})  # item id -> ThrottledMessageStream of the assistant reply
+    cl.user_session.set("connect_lock", asyncio.Lock())  # one connect at a time per chat
     async def handle_conversation_updated(event):
         item = event.get("item")
         delta = event.get("delta")
@@ -53,12 +97,22 @@ async def setup_openai_realtime():
             if 'audio' in delta:
                 audio = delta['audio']  # Int16Array, audio added
                 await cl.context.emitter.send_audio_chunk(cl.OutputAudioChunk(mimeType="pcm16", data=audio, track=cl.user_session.get("track_id")))
-            if 'transcript' in delta:
-                transcript = delta['transcript']
-                pass
+                openai_realtime.latency.mark("first_audio_sent")
+            if 'transcript' in delta or 'text' in delta:
+                # stream the assistant transcript (or text-only reply) into the chat as it arrives
+                message_streams = cl.user_session.get("message_streams")
+                stream = message_streams.get(item["id"])
+                if not stream:
+                    stream = message_streams[item["id"]] = ThrottledMessageStream()
+                await stream.append(delta.get('transcript') or delta.get('text'))
             if 'arguments' in delta:
                 arguments = delta['arguments']  # string, function arguments added
                 pass
+        elif item and item.get("status") in ("incomplete", "cancelled"):
+            # the reply was cut short and will never complete: end its message with what was streamed
+            stream = cl.user_session.get("message_streams").pop(item["id"], None)
+            if stream:
+                await stream.close()
             
     async def handle_item_completed(event):
         """Used to populate the chat context with transcription once an item is completed."""    
@@ -67,7 +121,13 @@ async def setup_openai_realtime():
         # Check if item exists and has the required keys
         if item and item.get("type") == "message" and item.get("status") and item.get("role") == "assistant":
             content = item.get("content")
-            if content:
+            stream = cl.user_session.get("message_streams").pop(item["id"], None)
+            if stream:
+                formatted = item.get("formatted", {})
+                await stream.close(content=formatted.get("transcript") or formatted.get("text") or None)
+            elif content and content[0].get("type") == "text":
+                await cl.Message(content=content[0].get("text", "")).send()
+            elif content:
                 # Assuming content is a list of dictionaries, extract the first transcript
                 #print(f"{item.get('type')} : {item.get('role')} : {content[0].get('transcript', 'Transcript not found')}")
                 await cl.Message(
@@ -91,13 +151,39 @@ async def setup_openai_realtime():
         #print(event)
         pass
     
+    async def close_message_streams(forget):
+        """Ends the messages of all replies still streaming; with `forget`, also drops them."""
+        message_streams = cl.user_session.get("message_streams")
+        for stream in list(message_streams.values()):
+            await stream.close()
+        if forget:
+            message_streams.clear()
+
     async def handle_conversation_interrupt(event):
         """Used to cancel the client previous audio playback."""
         cl.user_session.set("track_id", str(uuid4()))
         await cl.context.emitter.send_audio_interrupt()
+        # closed streams ignore the deltas still in flight; they are dropped once their item is done
+        await close_message_streams(forget=False)
         
     async def handle_error(event):
         logger.error(event)
+
+    async def handle_reconnected(event):
+        """The stalled socket was replaced by a new one, without the conversation so far."""
+        cl.user_session.set("track_id", str(uuid4()))
+        await cl.context.emitter.send_audio_interrupt()
+        await close_message_streams(forget=True)
+        await cl.Message(content="The connection to OpenAI realtime stalled and was reset, so the assistant no longer remembers the earlier turns.").send()
+
+    async def handle_disconnected(event):
+        """Tells the user why the realtime socket went away, unless they closed it themselves."""
+        admission.release(cl.user_session.get("id"))
+        await close_message_streams(forget=True)
+        if event.get("reason") == "idle":
+            await cl.Message(content="Disconnected after a period of inactivity. Press `P` or type a message to continue.").send()
+        elif event.get("reason") == "closed":
+            await cl.ErrorMessage(content="The connection to OpenAI realtime was closed. Press `P` or type a message to reconnect.").send()
         
     openai_realtime.on('conversation.updated', handle_conversation_updated)
     openai_realtime.on('conversation.item.completed', handle_item_completed)
@@ -105,6 +191,18 @@ async def setup_openai_realtime():
     openai_realtime.on('conversation.item.input_audio_transcription.completed', handle_conversation_input_completed) # get the transcribed text that the user voiced
     openai_realtime.on('response.function_call_arguments.done', handle_function_call_arguments_done) # get the transcribed text that the user voiced
     openai_realtime.on('error', handle_error)
+    openai_realtime.on('realtime.disconnected', handle_disconnected)
+    openai_realtime.on('realtime.reconnected', handle_reconnected)
+
+    if os.getenv("REALTIME_RECORD_DIR"):
+        record_file = os.path.join(os.getenv("REALTIME_RECORD_DIR"), f"{cl.user_session.get('id')}.jsonl")
+        cl.user_session.set("event_recorder", EventRecorder(openai_realtime.realtime, record_file))
+
+    if os.getenv("REALTIME_COMPACTION", "false").lower() == "true":
+        ConversationCompactor(openai_realtime)  # subscribes itself to response.done
+
+    if os.getenv("REALTIME_ADAPTIVE_VAD", "false").lower() == "true":
+        cl.user_session.set("adaptive_vad", AdaptiveVAD(openai_realtime))
 
     coros = [openai_realtime.add_tool(tool_def, tool_handler) for tool_def, tool_handler in tools]
     await asyncio.gather(*coros)
@@ -114,14 +212,45 @@ async def setup_openai_realtime():
 @cl.on_chat_start
 async def start():
     await cl.Message(
-        content="Welcome to a fun POC using Realtime API. Press `P` to talk!"
+        content="Welcome to a fun POC using Realtime API. Press `P` to talk or type a message!"
     ).send()
     await setup_openai_realtime()
 
 
+async def connect_realtime(openai_realtime: RealtimeClient, modalities):
+    """Connects the realtime client unless the process is out of sockets or token headroom."""
+    session_id = cl.user_session.get("id")
+    async with cl.user_session.get("connect_lock"):
+        if openai_realtime.is_connected():
+            # another message or tab of this chat connected while we waited
+            if "audio" in modalities:
+                await openai_realtime.enable_audio()
+            return True
+        sessions.register(session_id, openai_realtime)
+        if not sessions.reserve(session_id):
+            await cl.ErrorMessage(content="Too many active sessions right now, please try again in a moment.").send()
+            return False
+        try:
+            min_token_headroom = int(os.getenv("REALTIME_MIN_TOKEN_HEADROOM", "0"))
+            if not process_usage.has_headroom(min_tokens=min_token_headroom):
+                await cl.ErrorMessage(content="The assistant is busy right now, please try again in a moment.").send()
+                return False
+            await openai_realtime.connect(modalities=modalities)
+        finally:
+            # once connected the socket counts through open_sockets; on failure the slot is free again
+            sessions.release(session_id)
+    logger.info(f"Connected to OpenAI realtime ({'+'.join(modalities)}) track_id: {cl.user_session.get('track_id')}")
+    return True
+
 @cl.on_message
 async def on_message(message: cl.Message):
     openai_realtime: RealtimeClient = cl.user_session.get("openai_realtime")
+    if openai_realtime and not openai_realtime.is_connected():
+        # typed chat only needs text replies; audio is enabled when the user presses P
+        try:
+            await connect_realtime(openai_realtime, RealtimeClient.text_modalities)
+        except Exception as e:
+            await cl.ErrorMessage(content=f"Failed to connect to OpenAI realtime: {e}").send()
     if openai_realtime and openai_realtime.is_connected(): 
         # TODO: Try image processing with message.elements
         if not message.elements:  # this means there was not an attachment
@@ -147,23 +276,54 @@ async def on_message(message: cl.Message):
                     print("File url:", url)
 
             await openai_realtime.send_user_message_content([{ "type": 'input_text', "text": f"{message.content}: image: {url}" }])
-    else:
-        await cl.Message(content="Please activate voice mode before sending messages!").send()
+
+async def acquire_voice_slot(openai_realtime: RealtimeClient):
+    """Waits for an admission slot, showing the queue position while all voice slots are busy."""
+    queue_message = None
+
+    async def show_position(position):
+        nonlocal queue_message
+        content = f"All voice slots are busy, you are number {position} in the queue..."
+        if queue_message is None:
+            queue_message = cl.Message(content=content)
+            await queue_message.send()
+        else:
+            queue_message.content = content
+            await queue_message.update()
+
+    # sessions upgrading a typed chat already hold a socket, so they go first
+    priority = -1 if openai_realtime.is_connected() else None
+    admitted = await admission.acquire(cl.user_session.get("id"), priority=priority, on_position=show_position)
+    if queue_message:
+        await queue_message.remove()
+    if not admitted:
+        await cl.ErrorMessage(content="Voice is busy right now, please try again in a moment.").send()
+    return admitted
 
 @cl.on_audio_start
 async def on_audio_start():
+    connected = False
     try:
         openai_realtime: RealtimeClient = cl.user_session.get("openai_realtime")
+        if not await acquire_voice_slot(openai_realtime):
+            return False
+        if openai_realtime.is_connected():
+            # a typed chat is already running in text mode: keep its conversation
+            await openai_realtime.enable_audio()
+            connected = True
+            return True
         #print(SESSION_INSTRUCTIONS)
         #await openai_realtime.update_session(instructions=SESSION_INSTRUCTIONS, voice=voice)  # this will update the session instructions and voice
-        await openai_realtime.connect()
-        logger.info(f"Connected to OpenAI realtime track_id: {cl.user_session.get("track_id")}")
         # TODO: might want to recreate items to restore context
         # openai_realtime.create_conversation_item(item)
-        return True
+        connected = await connect_realtime(openai_realtime, RealtimeClient.audio_modalities)
+        return connected
     except Exception as e:
         await cl.ErrorMessage(content=f"Failed to connect to OpenAI realtime: {e}").send()
         return False
+    finally:
+        if not connected:
+            admission.release(cl.user_session.get("id"))
 
 @cl.on_audio_chunk
 async def on_audio_chunk(chunk: cl.InputAudioChunk):
@@ -174,9 +334,32 @@ async def on_audio_chunk(chunk: cl.InputAudioChunk):
         logger.info("RealtimeClient is not connected")
 
 @cl.on_audio_end
-@cl.on_chat_end
 @cl.on_stop
 async def on_end():
+    admission.release(cl.user_session.get("id"))
     openai_realtime: RealtimeClient = cl.user_session.get("openai_realtime")
     if openai_realtime and openai_realtime.is_connected():
-        await openai_realtime.disconnect()
\ No newline at end of file
+        logger.info(f"Realtime session memory usage: {openai_realtime.memory_usage()}")
+        logger.info(f"Realtime session token usage: {openai_realtime.get_usage()}")
+        logger.info(f"Realtime socket stats: {openai_realtime.get_socket_stats()}")
+        adaptive_vad = cl.user_session.get("adaptive_vad")
+        if adaptive_vad:
+            logger.info(f"Adaptive VAD: {adaptive_vad.stats()}")
+        trace_dump_dir = os.getenv("REALTIME_TRACE_DUMP_DIR")
+        if trace_dump_dir:
+            os.makedirs(trace_dump_dir, exist_ok=True)
+            trace_file = os.path.join(trace_dump_dir, f"{cl.user_session.get('id')}.jsonl")
+            logger.info(f"Realtime event trace written to {openai_realtime.realtime.tracer.dump_to_file(trace_file)}")
+        event_recorder = cl.user_session.get("event_recorder")
+        if event_recorder:
+            logger.info(f"Realtime session recorded to {event_recorder.flush()}")
+        await openai_realtime.disconnect()
+
+@cl.on_chat_end
+async def on_chat_end():
+    await on_end()
+    event_recorder = cl.user_session.get("event_recorder")
+    if event_recorder:
+        event_recorder.close()
+    # the chat is gone for good: drop its client, conversation and context from the registry
+    sessions.unregister(cl.user_session.get("id"))
\ No newline at end of file
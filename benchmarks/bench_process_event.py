@@ -0,0 +1,224 @@
+"""
+Microbenchmarks for RealtimeConversation.process_event, one per EventProcessors entry, with
+realistic event mixes. Runs from the repository root:
+
+    python -m benchmarks.bench_process_event
+    python -m benchmarks.bench_process_event --filter audio --no-save
+
+Each run is appended to benchmarks/results/process_event.jsonl together with the current
+git commit, and compared with the previous run: benchmarks that got slower than
+--threshold exit non-zero, so the suite can gate CI.
+"""
+
+import argparse
+import base64
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime
+
+from realtime import RealtimeConversation
+
+RESULTS_FILE = os.path.join(os.path.dirname(__file__), "results", "process_event.jsonl")
+AUDIO_DELTA = base64.b64encode(bytes(24000 * 2 // 10)).decode("utf-8")  # 100 ms of pcm16
+
+
+def event(type, **fields):
+    return {"type": type, **fields}
+
+
+def assistant_item(conversation, item_id, response_id="resp_1"):
+    if response_id not in conversation.response_lookup:
+        conversation.process_event(event("response.created", response={"id": response_id, "output": []}))
+    conversation.process_event(event("conversation.item.created", item={"id": item_id, "type": "message", "role": "assistant", "content": []}))
+    conversation.process_event(event("response.content_part.added", item_id=item_id, part={"type": "audio", "transcript": "", "text": ""}))
+
+
+def long_history(conversation, items):
+    for i in range(items):
+        role = "user" if i % 2 == 0 else "assistant"
+        conversation.process_event(event("conversation.item.created", item={"id": f"hist_{i}", "type": "message", "role": role, "content": [{"type": "input_text", "text": f"turn {i}"}]}))
+
+
+# Each benchmark is (setup, run): setup builds a conversation and returns the events to
+# process; run processes them. Only `run` is timed.
+
+def bench_item_created():
+    conversation = RealtimeConversation()
+    events = [event("conversation.item.created", item={"id": f"item_{i}", "type": "message", "role": "user", "content": [{"type": "input_text", "text": "hello"}]}) for i in range(500)]
+    return conversation, events
+
+
+def bench_item_created_function_call():
+    conversation = RealtimeConversation()
+    events = [event("conversation.item.created", item={"id": f"call_{i}", "type": "function_call", "name": "create_file", "call_id": f"c{i}", "arguments": ""}) for i in range(500)]
+    return conversation, events
+
+
+def bench_audio_delta_long_reply():
+    conversation = RealtimeConversation()
+    assistant_item(conversation, "reply")
+    return conversation, [event("response.audio.delta", item_id="reply", content_index=0, delta=AUDIO_DELTA) for _ in range(600)]  # 60 s reply
+
+
+def bench_audio_transcript_delta():
+    conversation = RealtimeConversation()
+    assistant_item(conversation, "reply")
+    return conversation, [event("response.audio_transcript.delta", item_id="reply", content_index=0, delta="word ") for _ in range(2000)]
+
+
+def bench_text_delta_many_short():
+    conversation = RealtimeConversation()
+    assistant_item(conversation, "reply")
+    return conversation, [event("response.text.delta", item_id="reply", content_index=0, delta="tok") for _ in range(5000)]
+
+
+def bench_function_call_arguments_large():
+    conversation = RealtimeConversation()
+    conversation.process_event(event("conversation.item.created", item={"id": "call", "type": "function_call", "name": "create_file", "call_id": "c", "arguments": ""}))
+    chunk = json.dumps({"file_content": "x" * 48})[:64]
+    events = [event("response.function_call_arguments.delta", item_id="call", delta=chunk) for _ in range(2000)]  # ~128 KB of arguments
+    events.append(event("response.function_call_arguments.done", item_id="call"))
+    return conversation, events
+
+
+def bench_output_item_lifecycle():
+    conversation = RealtimeConversation()
+    conversation.process_event(event("response.created", response={"id": "resp_1", "output": []}))
+    events = []
+    for i in range(300):
+        item = {"id": f"out_{i}", "type": "message", "role": "assistant", "content": []}
+        events += [
+            event("response.output_item.added", response_id="resp_1", item=item),
+            event("conversation.item.created", item=item),
+            event("response.content_part.added", item_id=item["id"], part={"type": "audio", "transcript": ""}),
+            event("response.output_item.done", item={**item, "status": "completed"}),
+        ]
+    return conversation, events
+
+
+def bench_response_created_and_done():
+    conversation = RealtimeConversation()
+    events = []
+    for i in range(500):
+        events.append(event("response.created", response={"id": f"resp_{i}", "output": []}))
+        events.append(event("response.done", response={"id": f"resp_{i}", "status": "completed", "usage": {"input_tokens": 1000, "output_tokens": 100}}))
+    return conversation, events
+
+
+def bench_rate_limits_updated():
+    conversation = RealtimeConversation()
+    rate_limits = [{"name": "requests", "limit": 1000, "remaining": 999, "reset_seconds": 60}, {"name": "tokens", "limit": 100000, "remaining": 99000, "reset_seconds": 1}]
+    return conversation, [event("rate_limits.updated", rate_limits=rate_limits) for _ in range(1000)]
+
+
+def bench_speech_started_stopped():
+    conversation = RealtimeConversation()
+    input_audio_buffer = bytearray(24000 * 2 * 60)
+    events = []
+    for i in range(300):
+        events.append((event("input_audio_buffer.speech_started", item_id=f"speech_{i}", audio_start_ms=i * 100),))
+        events.append((event("input_audio_buffer.speech_stopped", item_id=f"speech_{i}", audio_end_ms=i * 100 + 2000), input_audio_buffer))
+    return conversation, events
+
+
+def bench_input_transcription_completed():
+    conversation = RealtimeConversation()
+    long_history(conversation, 500)
+    return conversation, [event("conversation.item.input_audio_transcription.completed", item_id=f"hist_{i}", content_index=0, transcript="what the user said") for i in range(0, 500, 2)]
+
+
+def bench_truncate_in_long_history():
+    conversation = RealtimeConversation()
+    long_history(conversation, 1000)
+    assistant_item(conversation, "reply")
+    for _ in range(300):
+        conversation.process_event(event("response.audio.delta", item_id="reply", content_index=0, delta=AUDIO_DELTA))
+    return conversation, [event("conversation.item.truncated", item_id="reply", audio_end_ms=30000 - i * 50) for i in range(200)]
+
+
+def bench_delete_in_long_history():
+    conversation = RealtimeConversation()
+    long_history(conversation, 2000)
+    return conversation, [event("conversation.item.deleted", item_id=f"hist_{i}") for i in range(0, 2000, 4)]
+
+
+BENCHMARKS = {name[len("bench_"):]: fn for name, fn in sorted(globals().items()) if name.startswith("bench_")}
+
+
+def run_benchmark(setup, repeat):
+    """Returns the median seconds per event over `repeat` fresh runs."""
+    timings = []
+    for _ in range(repeat):
+        conversation, events = setup()
+        process_event = conversation.process_event
+        started = time.perf_counter()
+        for args in events:
+            if isinstance(args, tuple):
+                process_event(*args)
+            else:
+                process_event(args)
+        timings.append((time.perf_counter() - started) / len(events))
+        conversation.clear()
+    return statistics.median(timings)
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def previous_run():
+    if not os.path.exists(RESULTS_FILE):
+        return None
+    with open(RESULTS_FILE, "r", encoding="utf-8") as file:
+        lines = [line for line in file if line.strip()]
+    return json.loads(lines[-1]) if lines else None
+
+
+def main(args):
+    baseline = previous_run()
+    results = {}
+    regressions = []
+    print(f"{'benchmark':<36} {'us/event':>10} {'previous':>10} {'change':>8}")
+    for name, setup in BENCHMARKS.items():
+        if args.filter and args.filter not in name:
+            continue
+        seconds = run_benchmark(setup, args.repeat)
+        results[name] = seconds
+        previous = (baseline or {}).get("results", {}).get(name)
+        change = f"{(seconds / previous - 1) * 100:+.0f}%" if previous else ""
+        print(f"{name:<36} {seconds * 1e6:>10.2f} {previous * 1e6 if previous else float('nan'):>10.2f} {change:>8}")
+        if previous and seconds > previous * (1 + args.threshold):
+            regressions.append(name)
+
+    if args.save:
+        os.makedirs(os.path.dirname(RESULTS_FILE), exist_ok=True)
+        with open(RESULTS_FILE, "a", encoding="utf-8") as file:
+            json.dump({
+                "timestamp": datetime.now().isoformat(),
+                "commit": git_commit(),
+                "python": platform.python_version(),
+                "machine": platform.node(),
+                "results": results,
+            }, file)
+            file.write("\n")
+
+    if regressions:
+        print(f"Regressions over {args.threshold:.0%}: {', '.join(regressions)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--filter", help="only run benchmarks whose name contains this")
+    parser.add_argument("--repeat", type=int, default=7)
+    parser.add_argument("--threshold", type=float, default=0.25, help="relative slowdown reported as a regression")
+    parser.add_argument("--no-save", dest="save", action="store_false", help="do not append this run to the results history")
+    main(parser.parse_args())
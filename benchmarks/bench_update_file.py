@@ -0,0 +1,163 @@
+"""
+Benchmarks UpdateFileTool's two update modes against each other as the file grows. Runs from
+the repository root:
+
+    python -m benchmarks.bench_update_file --sizes 1,4,16,64
+    python -m benchmarks.bench_update_file --sizes 4,16 --live --model fast_model
+
+Each size gets a generated file with a one-line change to make. "rewrite" has the model return
+the whole updated file (UPDATE_FILE_MODE=rewrite), "edit" has it return search/replace edits
+that are applied locally (UPDATE_FILE_MODE=edit). By default the model is a local
+OpenAI-compatible server that answers after --ttft-ms and then produces --tokens-per-second
+(about four characters per token), so the numbers show how the output size drives latency
+without network noise; --live uses the OpenAI API from .env instead.
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import statistics
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+os.environ["USE_AZURE"] = "false"
+
+from chainlit.context import context, init_http_context  # noqa: E402
+from chainlit.emitter import BaseChainlitEmitter  # noqa: E402
+from chainlit.logger import logger  # noqa: E402
+
+from tools.file_tools import UpdateFileTool  # noqa: E402
+from utils import llm  # noqa: E402
+from utils.rate_limiter import scheduler  # noqa: E402
+from utils.utils import ModelName  # noqa: E402
+
+FILE_NAME = "notes.md"
+PROMPT = "In the line 'line {line}: status is TODO', change the status to DONE."
+
+
+class SimulatedModel(BaseHTTPRequestHandler):
+    """Chat completions endpoint that answers with `server.reply` at a fixed token rate."""
+
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        content = json.dumps(self.server.reply)
+        time.sleep(self.server.ttft)
+        completion = {"id": "bench", "created": 0, "model": body["model"]}
+        if not body.get("stream"):
+            time.sleep(len(content) / 4 / self.server.tokens_per_second)
+            choice = {"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": content}}
+            self.send_json({**completion, "object": "chat.completion", "choices": [choice]})
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        chunk = {**completion, "object": "chat.completion.chunk"}
+        for start in range(0, len(content), 64):
+            time.sleep(16 / self.server.tokens_per_second)
+            self.send_event({**chunk, "choices": [{"index": 0, "delta": {"content": content[start:start + 64]}, "finish_reason": None}]})
+        self.send_event({**chunk, "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]})
+        self.send_event("[DONE]")
+        self.wfile.write(b"0\r\n\r\n")
+
+    def send_json(self, payload):
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def send_event(self, payload):
+        data = f"data: {payload if isinstance(payload, str) else json.dumps(payload)}\n\n".encode("utf-8")
+        self.wfile.write(f"{len(data):x}\r\n".encode("utf-8") + data + b"\r\n")
+        self.wfile.flush()
+
+
+def start_simulated_model(args):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), SimulatedModel)
+    server.reply = None
+    server.ttft = args.ttft_ms / 1000
+    server.tokens_per_second = args.tokens_per_second
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def generate_file(kilobytes):
+    lines = []
+    size = 0
+    while size < kilobytes * 1024:
+        line = f"line {len(lines)}: status is TODO, owner is someone, notes follow here"
+        lines.append(line)
+        size += len(line) + 1
+    return "\n".join(lines) + "\n", len(lines) // 2
+
+
+async def run_mode(tool, mode, scratch_pad_dir, original, line, args, server):
+    target = f"line {line}: status is TODO"
+    if server is not None:
+        if mode == "edit":
+            edits = [{"search": target, "replace": f"line {line}: status is DONE"}]
+            server.reply = {"file": FILE_NAME, "edits": edits, "model": args.model}
+        else:
+            updated = original.replace(target, f"line {line}: status is DONE", 1)
+            server.reply = {"file": FILE_NAME, "file_content": updated, "model": args.model}
+    timings = []
+    for _ in range(args.repeat):
+        with open(os.path.join(scratch_pad_dir, FILE_NAME), "w") as f:
+            f.write(original)
+        update = tool.update_with_edits if mode == "edit" else tool.update_with_rewrite
+        started = time.perf_counter()
+        try:
+            await update(scratch_pad_dir, FILE_NAME, original, PROMPT.format(line=line), "", ModelName(args.model))
+        except ValueError as e:
+            logger.warning(f"{mode} failed: {e}")
+            continue
+        timings.append(time.perf_counter() - started)
+    return statistics.median(timings) * 1000 if timings else None
+
+
+async def main(args):
+    logger.setLevel(logging.WARNING)
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    server = None
+    if not args.live:
+        server = start_simulated_model(args)
+        os.environ["OPENAI_BASE_URL"] = f"http://127.0.0.1:{server.server_port}/v1"
+        # the scheduler was built at import time from LLM_DEFAULT_*; the local model has no limits
+        scheduler.default_rpm = scheduler.default_tpm = 1e9
+        llm.config.setdefault("OPENAI_API_KEY", "fake")
+    init_http_context()
+    context.emitter = BaseChainlitEmitter(context.session)
+    tool = UpdateFileTool()
+    print(f"{'size KB':>8} {'rewrite ms':>11} {'edit ms':>9} {'speedup':>8}")
+    with tempfile.TemporaryDirectory() as scratch_pad_dir:
+        for kilobytes in args.sizes:
+            original, line = generate_file(kilobytes)
+            rewrite = await run_mode(tool, "rewrite", scratch_pad_dir, original, line, args, server)
+            edit = await run_mode(tool, "edit", scratch_pad_dir, original, line, args, server)
+            speedup = f"{rewrite / edit:.1f}x" if rewrite and edit else "-"
+            print(f"{kilobytes:>8} {rewrite or float('nan'):>11.0f} {edit or float('nan'):>9.0f} {speedup:>8}")
+    await llm.close_client()
+    if server is not None:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=lambda value: [int(size) for size in value.split(",")], default=[1, 4, 16, 64], help="file sizes in KB")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--model", default="fast_model", choices=[name.value for name in ModelName])
+    parser.add_argument("--live", action="store_true", help="use the OpenAI API instead of the simulated model")
+    parser.add_argument("--ttft-ms", type=float, default=400, help="simulated time to first token")
+    parser.add_argument("--tokens-per-second", type=float, default=100, help="simulated output speed")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,60 @@
+"""
+Benchmarks websocket transport settings of the realtime socket against the local fake
+Realtime server. Runs from the repository root:
+
+    python -m benchmarks.bench_ws_transport --turns 20 --audio-chunks 50
+
+For each setting it replays the same audio-heavy replies and reports event throughput,
+payload throughput and CPU time per MB. Client and server share the process and use the
+same compression, so CPU covers both ends of the socket.
+"""
+
+import argparse
+import asyncio
+import logging
+import time
+
+from chainlit.logger import logger
+
+from benchmarks.realtime_replay import run_turns
+from realtime.fake_server import FakeRealtimeServer, synthetic_response
+
+SETTINGS = {
+    "defaults (deflate)": {},
+    "no compression": {"compression": None},
+    "no compression, max_queue=None": {"compression": None, "max_queue": None},
+    "no compression, write_limit=1MB": {"compression": None, "write_limit": 2 ** 20},
+    "no compression, max_size=16MB": {"compression": None, "max_size": 2 ** 24},
+    "no compression, no pings": {"compression": None, "ping_interval": None},
+}
+
+
+async def run_setting(transport, args):
+    server_kwargs = {"compression": transport["compression"]} if "compression" in transport else {}
+    if "max_size" in transport:
+        server_kwargs["max_size"] = transport["max_size"]
+    script = synthetic_response(audio_chunks=args.audio_chunks, noise=True)
+    cpu_started = time.process_time()
+    async with FakeRealtimeServer([script], speed=None, **server_kwargs) as server:
+        _, events, elapsed = await run_turns(server.url, args.turns, transport=transport)
+        megabytes = server.bytes_sent / 1024 / 1024
+    cpu = time.process_time() - cpu_started
+    return events / elapsed, megabytes / elapsed, cpu / megabytes
+
+
+async def main(args):
+    logger.setLevel(logging.WARNING)
+    logging.getLogger("websockets").setLevel(logging.WARNING)
+    print(f"{'setting':<36} {'events/s':>10} {'MB/s':>8} {'cpu s/MB':>9}")
+    for name, transport in SETTINGS.items():
+        results = [await run_setting(transport, args) for _ in range(args.repeat)]
+        events_per_second, megabytes_per_second, cpu_per_megabyte = (sorted(values)[len(values) // 2] for values in zip(*results))
+        print(f"{name:<36} {events_per_second:>10.0f} {megabytes_per_second:>8.1f} {cpu_per_megabyte:>9.3f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--turns", type=int, default=10)
+    parser.add_argument("--audio-chunks", type=int, default=50, help="100 ms audio deltas per reply")
+    parser.add_argument("--repeat", type=int, default=3)
+    asyncio.run(main(parser.parse_args()))
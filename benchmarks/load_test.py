@@ -0,0 +1,179 @@
+"""
+Load generator for the Chainlit voice app. Runs from the repository root, fully offline:
+
+    python -m benchmarks.load_test --sessions 5,10,20,40 --turns 3
+
+Each simulated user goes through the app's own handlers (on_chat_start, on_audio_start,
+on_audio_chunk, on_message, on_audio_end) inside a Chainlit HTTP context, with the realtime
+client pointed at a local fake Realtime server. Audio is streamed in real time and the audio
+chunks the app sends back to the "browser" are timestamped. For each concurrency level it
+reports audio delivery jitter and playback underruns, event-loop lag, CPU and memory, and
+stops at the first level that breaks the SLOs. With REALTIME_MAX_VOICE_SESSIONS set, users over
+the limit queue in on_audio_start and the time they waited is reported as well. The fake server shares the process, so CPU
+and memory are an upper bound for the app alone.
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import resource
+import time
+
+os.environ["USE_AZURE"] = "false"
+os.environ.setdefault("OPENAI_API_KEY", "fake")
+
+import chainlit as cl  # noqa: E402
+from chainlit.config import config  # noqa: E402
+from chainlit.context import context, init_http_context  # noqa: E402
+from chainlit.emitter import BaseChainlitEmitter  # noqa: E402
+from chainlit.logger import logger  # noqa: E402
+
+from realtime.fake_server import FakeRealtimeServer, synthetic_response  # noqa: E402
+from utils.metrics import quantile  # noqa: E402
+
+SAMPLE_RATE = config.features.audio.sample_rate
+UNDERRUN_TOLERANCE = 0.02  # the browser buffers a little audio
+NEW_UTTERANCE_GAP = 0.5  # silence longer than this starts a new reply rather than an underrun
+
+
+class RecordingEmitter(BaseChainlitEmitter):
+    """Emitter stub that timestamps the audio chunks sent to the browser."""
+
+    def __init__(self, session, stats):
+        super().__init__(session)
+        self.stats = stats
+        self.playback_end = None
+
+    async def send_audio_chunk(self, chunk):
+        now = time.perf_counter()
+        duration = len(chunk["data"]) / 2 / SAMPLE_RATE
+        if self.playback_end is not None and now - self.playback_end > NEW_UTTERANCE_GAP:
+            self.stats["last_arrival"] = self.playback_end = None
+        if self.stats["last_arrival"] is not None:
+            self.stats["gaps"].append(now - self.stats["last_arrival"] - self.stats["last_duration"])
+        if self.playback_end is not None and now - self.playback_end > UNDERRUN_TOLERANCE:
+            # the browser ran out of audio before this chunk arrived
+            self.stats["underruns"] += 1
+        self.playback_end = max(now, self.playback_end or now) + duration
+        self.stats["last_arrival"] = now
+        self.stats["last_duration"] = duration
+        self.stats["chunks"] += 1
+
+    async def send_audio_interrupt(self):
+        self.stats["last_arrival"] = None
+        self.playback_end = None
+
+
+async def simulated_user(app, args, stats):
+    init_http_context()
+    context.emitter = RecordingEmitter(context.session, stats)
+    await app.start()
+    started = time.perf_counter()
+    admitted = await app.on_audio_start()
+    stats["admission_wait"] = time.perf_counter() - started
+    if not admitted:
+        stats["failed"] = True
+        return
+    chunk = bytes(SAMPLE_RATE * 2 * args.chunk_ms // 1000)
+    elapsed = 0
+    for turn in range(args.turns):
+        for i in range((args.speech_ms + args.silence_ms) // args.chunk_ms):
+            await app.on_audio_chunk(cl.InputAudioChunk(isStart=elapsed == 0, mimeType="pcm16", elapsedTime=elapsed, data=chunk))
+            elapsed += args.chunk_ms
+            await asyncio.sleep(args.chunk_ms / 1000)
+        if args.typed_messages:
+            await app.on_message(cl.Message(content=f"typed message {turn}"))
+    await app.on_chat_end()
+
+
+async def measure_loop_lag(lags, interval=0.05):
+    while True:
+        started = time.perf_counter()
+        await asyncio.sleep(interval)
+        lags.append(time.perf_counter() - started - interval)
+
+
+def rss_megabytes():
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1024 / 1024
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+async def run_level(app, sessions, args):
+    users = [{"gaps": [], "underruns": 0, "chunks": 0, "last_arrival": None, "last_duration": 0, "failed": False, "admission_wait": 0} for _ in range(sessions)]
+    lags = []
+    lag_task = asyncio.create_task(measure_loop_lag(lags))
+    cpu_started, wall_started = time.process_time(), time.perf_counter()
+    await asyncio.gather(*(simulated_user(app, args, stats) for stats in users))
+    cpu = time.process_time() - cpu_started
+    wall = time.perf_counter() - wall_started
+    lag_task.cancel()
+    gaps = sorted(abs(gap) for stats in users for gap in stats["gaps"])
+    lags.sort()
+    admission_waits = sorted(stats["admission_wait"] for stats in users)
+    return {
+        "sessions": sessions,
+        "failed_sessions": sum(stats["failed"] for stats in users),
+        "audio_chunks": sum(stats["chunks"] for stats in users),
+        "underruns": sum(stats["underruns"] for stats in users),
+        "jitter_p50_ms": quantile(gaps, 0.5) * 1000,
+        "jitter_p95_ms": quantile(gaps, 0.95) * 1000,
+        "jitter_p99_ms": quantile(gaps, 0.99) * 1000,
+        "admission_wait_p95_ms": quantile(admission_waits, 0.95) * 1000,
+        "loop_lag_p95_ms": quantile(lags, 0.95) * 1000,
+        "loop_lag_max_ms": (lags[-1] if lags else 0) * 1000,
+        "cpu_percent": cpu / wall * 100,
+        "rss_mb": rss_megabytes(),
+    }
+
+
+def breaks_slo(result, args):
+    reasons = []
+    if result["failed_sessions"]:
+        reasons.append(f"{result['failed_sessions']} sessions failed to connect")
+    if result["jitter_p95_ms"] > args.max_jitter_ms:
+        reasons.append(f"p95 audio jitter {result['jitter_p95_ms']:.0f} ms > {args.max_jitter_ms} ms")
+    if result["loop_lag_p95_ms"] > args.max_loop_lag_ms:
+        reasons.append(f"p95 event-loop lag {result['loop_lag_p95_ms']:.0f} ms > {args.max_loop_lag_ms} ms")
+    return reasons
+
+
+async def main(args):
+    logger.setLevel(logging.WARNING)
+    logging.getLogger("websockets").setLevel(logging.WARNING)
+    script = synthetic_response(audio_chunks=args.reply_chunks, chunk_ms=args.chunk_ms)
+    async with FakeRealtimeServer([script], speed=1.0, vad_turn_ms=args.speech_ms, vad_silence_ms=args.silence_ms) as server:
+        os.environ["OPENAI_REALTIME_URL"] = server.url
+        import app
+
+        print(f"{'sessions':>8} {'chunks':>7} {'underruns':>9} {'jit p50':>8} {'jit p95':>8} {'jit p99':>8} {'lag p95':>8} {'lag max':>8} {'admit p95':>9} {'cpu %':>6} {'rss MB':>7}")
+        for sessions in args.sessions:
+            result = await run_level(app, sessions, args)
+            print(
+                f"{result['sessions']:>8} {result['audio_chunks']:>7} {result['underruns']:>9} "
+                f"{result['jitter_p50_ms']:>8.1f} {result['jitter_p95_ms']:>8.1f} {result['jitter_p99_ms']:>8.1f} "
+                f"{result['loop_lag_p95_ms']:>8.1f} {result['loop_lag_max_ms']:>8.1f} {result['admission_wait_p95_ms']:>9.0f} {result['cpu_percent']:>6.0f} {result['rss_mb']:>7.0f}"
+            )
+            reasons = breaks_slo(result, args)
+            if reasons:
+                print(f"SLO broken at {sessions} concurrent sessions: {'; '.join(reasons)}")
+                return
+        print(f"SLOs held up to {args.sessions[-1]} concurrent sessions")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", type=lambda value: [int(n) for n in value.split(",")], default=[1, 5, 10, 20, 40, 80],
+                        help="comma separated concurrency levels to ramp through")
+    parser.add_argument("--turns", type=int, default=2, help="voice turns per simulated user")
+    parser.add_argument("--typed-messages", action="store_true", help="also send a typed message after each turn")
+    parser.add_argument("--chunk-ms", type=int, default=100, help="audio per input and output chunk")
+    parser.add_argument("--speech-ms", type=int, default=1500, help="speech per user turn")
+    parser.add_argument("--silence-ms", type=int, default=3000, help="silence after each user turn while the reply plays")
+    parser.add_argument("--reply-chunks", type=int, default=25, help="audio chunks per assistant reply")
+    parser.add_argument("--max-jitter-ms", type=float, default=100)
+    parser.add_argument("--max-loop-lag-ms", type=float, default=50)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,68 @@
+"""
+Replays realtime event scripts against RealtimeClient over a local fake server and reports
+throughput and per-turn latency. Runs offline; start it from the repository root:
+
+    python -m benchmarks.realtime_replay --turns 20 --speed 0
+    python -m benchmarks.realtime_replay --script recorded_session.jsonl --speed 1
+"""
+
+import argparse
+import asyncio
+import os
+import time
+
+os.environ["USE_AZURE"] = "false"
+
+from realtime import RealtimeClient  # noqa: E402
+from realtime.fake_server import FakeRealtimeServer, load_script, synthetic_response  # noqa: E402
+from utils.metrics import quantile  # noqa: E402
+
+
+async def run_turns(url, turns, transport=None):
+    client = RealtimeClient(url=url, api_key="fake", transport=transport)
+    latencies = []
+    events = 0
+
+    def count_event(event):
+        nonlocal events
+        events += 1
+
+    client.realtime.on("server.*", count_event)
+    await client.connect()
+    await client.wait_for_session_created()
+    started = time.perf_counter()
+    for turn in range(turns):
+        turn_started = time.perf_counter()
+        done = asyncio.ensure_future(client.wait_for_next("response.done"))
+        await client.send_user_message_content([{"type": "input_text", "text": f"turn {turn}"}])
+        await done
+        latencies.append(time.perf_counter() - turn_started)
+    elapsed = time.perf_counter() - started
+    await client.disconnect()
+    return latencies, events, elapsed
+
+
+async def main(args):
+    scripts = load_script(args.script) if args.script else [synthetic_response(audio_chunks=args.audio_chunks)]
+    cpu_started = time.process_time()
+    async with FakeRealtimeServer(scripts, speed=args.speed or None) as server:
+        latencies, events, elapsed = await run_turns(server.url, args.turns)
+        megabytes = server.bytes_sent / 1024 / 1024
+    cpu = time.process_time() - cpu_started
+    latencies.sort()
+    print(f"turns:            {args.turns}")
+    print(f"server events:    {events} ({events / elapsed:.0f}/s)")
+    print(f"server payload:   {megabytes:.1f} MB ({megabytes / elapsed:.1f} MB/s)")
+    print(f"turn latency p50: {quantile(latencies, 0.5) * 1000:.1f} ms")
+    print(f"turn latency p95: {quantile(latencies, 0.95) * 1000:.1f} ms")
+    print(f"turn latency p99: {quantile(latencies, 0.99) * 1000:.1f} ms")
+    print(f"cpu time:         {cpu:.2f} s ({cpu / elapsed * 100:.0f}% of wall time)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--script", help="JSONL event script to replay (default: synthetic audio reply)")
+    parser.add_argument("--speed", type=float, default=0, help="playback speed multiplier, 0 for no delays")
+    parser.add_argument("--turns", type=int, default=10)
+    parser.add_argument("--audio-chunks", type=int, default=20, help="audio deltas per synthetic reply")
+    asyncio.run(main(parser.parse_args()))
@@ -3,17 +3,27 @@
 import os
 import asyncio
 import inspect
+import logging
 import numpy as np
 import json
 import websockets
 from datetime import datetime, UTC, timezone
 from collections import defaultdict
 import base64
+import time
 import uuid
 
 from chainlit.logger import logger
 from chainlit.config import config # reads from the config.toml file for chainlit
 
+from .accounting import UsageAccount, process_usage, usage_entry
+from .audio_store import AudioStore, audio_nbytes
+from .event_logging import EventLogSampler, elide_payloads
+from .keepalive import SocketMonitor
+from .latency import TurnLatencyTracker
+from .tracing import EventTracer, generate_id
+from .transport import TRANSPORT_SETTINGS, transport_config_from_env
+
 
 def float_to_16bit_pcm(float32_array):
     """
@@ -83,6 +93,7 @@ class RealtimeAPI(RealtimeEventHandler):
         api_key=None,
         api_version="2024-10-01-preview",
         deployment=None,
+        transport=None,
         ):
 
         super().__init__()
@@ -99,16 +110,32 @@ class RealtimeAPI(RealtimeEventHandler):
             self.request_id = uuid.uuid4()
         else:
             self.default_url = "wss://api.openai.com/v1/realtime"
-            self.url = url or self.default_url
+            self.url = url or os.getenv("OPENAI_REALTIME_URL") or self.default_url
             self.api_key = api_key or os.getenv("OPENAI_API_KEY")
 
+        # websockets.connect settings (max_size, max_queue, write_limit, compression, ping_interval, ...)
+        self.transport = {**transport_config_from_env(), **(transport or {})}
+        unknown = set(self.transport) - set(TRANSPORT_SETTINGS)
+        if unknown:
+            raise ValueError(f"Unknown websocket transport settings: {', '.join(sorted(unknown))}")
+
         self.ws = None
+        self.last_activity = time.monotonic()
+        self.tracer = EventTracer()
+        self.log_sampler = EventLogSampler()
+        self.monitor = SocketMonitor(self)
 
     def is_connected(self):
         return self.ws is not None
 
     def log(self, *args):
-        logger.debug(f"[Websocket/{datetime.now(UTC).isoformat()}]", *args)
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(" ".join([f"[Websocket/{datetime.now(UTC).isoformat()}]", *map(str, args)]))
+
+    def log_event(self, direction, event):
+        """Logs an event without its audio payloads; skipped entirely unless debug logging is on."""
+        if logger.isEnabledFor(logging.DEBUG) and self.log_sampler.should_log(event['type']):
+            self.log(f"{direction}:", elide_payloads(event))
 
     async def connect(self, model='gpt-4o-realtime-preview'):
         if self.is_connected():
@@ -128,6 +155,7 @@ class RealtimeAPI(RealtimeEventHandler):
                     "User-Agent": self.user_agent,
                     "x-ms-client-request-id": str(self.request_id),
                 },
+                **self.transport,
             )
         else:
             # logger.info(f"Connecting to OpenAI URL: {self.url}")
@@ -137,19 +165,34 @@ class RealtimeAPI(RealtimeEventHandler):
                     "Authorization": f"Bearer {self.api_key}",
                     "OpenAI-Beta": "realtime=v1",
                 },
+                **self.transport,
             )
         self.log(f"Connected to {self.url}")
-        asyncio.create_task(self._receive_messages())
-
-    async def _receive_messages(self):
-        async for message in self.ws:
-            event = json.loads(message)
-            if event['type'] == "error":
-                print("here we are")
-                logger.error("❌ ERROR", message)
-            self.log("received:", event)
-            self.dispatch(f"server.{event['type']}", event)
-            self.dispatch("server.*", event)
+        self.last_activity = time.monotonic()
+        asyncio.create_task(self._receive_messages(self.ws))
+        self.monitor.start()
+
+    async def _receive_messages(self, ws):
+        # the socket is passed in: by the time this task runs, a disconnect or reconnect may have replaced self.ws
+        try:
+            async for message in ws:
+                event = json.loads(message)
+                self.last_activity = time.monotonic()
+                self.monitor.frame_received(event)
+                self.tracer.received(event)
+                if event['type'] == "error":
+                    logger.error(f"❌ ERROR {event.get('error')}")
+                self.log_event("received", event)
+                self.dispatch(f"server.{event['type']}", event)
+                self.dispatch("server.*", event)
+        except websockets.ConnectionClosed as e:
+            self.log(f"Connection closed: {e}")
+        finally:
+            if self.ws is ws:
+                # closed by the server or the network rather than by disconnect()
+                self.ws = None
+                self.monitor.stop()
+                self.dispatch("close", {"code": ws.close_code, "reason": ws.close_reason})
 
     async def send(self, event_name, data=None):
         if not self.is_connected():
@@ -162,22 +205,31 @@ class RealtimeAPI(RealtimeEventHandler):
             "type": event_name,
             **data
         }
+        if event_name == "conversation.item.create" and "id" not in event["item"]:
+            # lets the tracer tell our items from the server's in conversation.item.created
+            event["item"] = {"id": self._generate_id("item_"), **event["item"]}
         self.dispatch(f"client.{event_name}", event)
         self.dispatch("client.*", event)
-        self.log("sent:", event)
+        self.log_event("sent", event)
+        self.tracer.sent(event)
+        if event_name == "response.create":
+            self.monitor.response_requested()
+        self.last_activity = time.monotonic()
         await self.ws.send(json.dumps(event))
 
     def _generate_id(self, prefix):
-        return f"{prefix}{int(datetime.now(timezone.utc).timestamp() * 1000)}"
+        return generate_id(prefix)
 
     async def disconnect(self):
+        self.monitor.stop()
         if self.ws:
-            await self.ws.close()
-            self.ws = None
+            ws, self.ws = self.ws, None
+            await ws.close()
             self.log(f"Disconnected from {self.url}")
 
 class RealtimeConversation:
     default_frequency = config.features.audio.sample_rate
+    sample_width = 2  # bytes per pcm16 sample
     
     EventProcessors = {
         'conversation.item.created': lambda self, event: self._process_item_created(event),
@@ -185,7 +237,7 @@ class RealtimeConversation:
         'conversation.item.deleted': lambda self, event: self._process_item_deleted(event),
         'conversation.item.input_audio_transcription.completed': lambda self, event: self._process_input_audio_transcription_completed(event),
         'input_audio_buffer.speech_started': lambda self, event: self._process_speech_started(event),
-        'input_audio_buffer.speech_stopped': lambda self, event, input_audio_buffer: self._process_speech_stopped(event, input_audio_buffer),
+        'input_audio_buffer.speech_stopped': lambda self, event, *args: self._process_speech_stopped(event, *args),
         'response.created': lambda self, event: self._process_response_created(event),
         'response.output_item.added': lambda self, event: self._process_output_item_added(event),
         'response.output_item.done': lambda self, event: self._process_output_item_done(event),
@@ -195,12 +247,17 @@ class RealtimeConversation:
         'response.text.delta': lambda self, event: self._process_text_delta(event),
         'response.function_call_arguments.delta': lambda self, event: self._process_function_call_arguments_delta(event),
         'response.function_call_arguments.done': lambda self, event: self._process_function_call_arguments_done(event),
+        'response.done': lambda self, event: self._process_response_done(event),
+        'rate_limits.updated': lambda self, event: self._process_rate_limits_updated(event),
     }
     
     def __init__(self):
+        self.audio_store = AudioStore()
+        self.usage = UsageAccount(parent=process_usage)  # outlives clear() so it covers the whole session
         self.clear()
 
     def clear(self):
+        self.audio_store.reset()
         self.item_lookup = {}
         self.items = []
         self.response_lookup = {}
@@ -224,12 +281,43 @@ class RealtimeConversation:
     def get_items(self):
         return self.items[:]
 
+    def audio_bytes(self, ms):
+        """Returns the number of pcm16 bytes in `ms` milliseconds of audio."""
+        return (ms * self.default_frequency) // 1000 * self.sample_width
+
+    def speech_in_progress(self):
+        return any('audio_end_ms' not in speech for speech in self.queued_speech_items.values())
+
+    def memory_usage(self):
+        """Reports how much memory the conversation holds, audio and text separately."""
+        text_bytes = sum(
+            len(item['formatted']['text']) + len(item['formatted']['transcript'])
+            for item in self.items
+        )
+        queued_audio_bytes = sum(
+            audio_nbytes(speech.get('audio')) for speech in self.queued_speech_items.values()
+        ) + audio_nbytes(self.queued_input_audio)
+        return {
+            "items": len(self.items),
+            "text_bytes": text_bytes,
+            "queued_audio_bytes": queued_audio_bytes,
+            **self.audio_store.usage(),
+        }
+
+    def _enforce_audio_budget(self):
+        if self.audio_store.over_budget():
+            self.audio_store.enforce(self.items)
+
     def _process_item_created(self, event):
         item = event['item']
         new_item = item.copy()
         if new_item['id'] not in self.item_lookup:
             self.item_lookup[new_item['id']] = new_item
-            self.items.append(new_item)
+            previous_item = self.item_lookup.get(event.get('previous_item_id'))
+            if previous_item and previous_item is not self.items[-1]:
+                self.items.insert(self.items.index(previous_item) + 1, new_item)
+            else:
+                self.items.append(new_item)
         new_item['formatted'] = {
             'audio': [],
             'text': '',
@@ -253,6 +341,8 @@ class RealtimeConversation:
                     self.queued_input_audio = None
             else:
                 new_item['status'] = 'in_progress'
+            self.audio_store.account(new_item)
+            self._enforce_audio_budget()
         elif new_item['type'] == 'function_call':
             new_item['formatted']['tool'] = {
                 'type': 'function',
@@ -272,9 +362,9 @@ class RealtimeConversation:
         item = self.item_lookup.get(item_id)
         if not item:
             raise Exception(f'item.truncated: Item "{item_id}" not found')
-        end_index = (audio_end_ms * self.default_frequency) // 1000
         item['formatted']['transcript'] = ''
-        item['formatted']['audio'] = item['formatted']['audio'][:end_index]
+        self.audio_store.truncate(item, self.audio_bytes(audio_end_ms))
+        self._enforce_audio_budget()
         return item, None
 
     def _process_item_deleted(self, event):
@@ -284,6 +374,7 @@ class RealtimeConversation:
             raise Exception(f'item.deleted: Item "{item_id}" not found')
         del self.item_lookup[item['id']]
         self.items.remove(item)
+        self.audio_store.discard(item)
         return item, None
 
     def _process_input_audio_transcription_completed(self, event):
@@ -306,14 +397,17 @@ class RealtimeConversation:
         self.queued_speech_items[item_id] = {'audio_start_ms': audio_start_ms}
         return None, None
 
-    def _process_speech_stopped(self, event, input_audio_buffer):
+    def _process_speech_stopped(self, event, input_audio_buffer, input_audio_offset=0):
+        """
+        :param input_audio_buffer: the audio appended so far, minus the first `input_audio_offset` bytes
+        """
         item_id = event['item_id']
         audio_end_ms = event['audio_end_ms']
         speech = self.queued_speech_items[item_id]
         speech['audio_end_ms'] = audio_end_ms
         if input_audio_buffer:
-            start_index = (speech['audio_start_ms'] * self.default_frequency) // 1000
-            end_index = (speech['audio_end_ms'] * self.default_frequency) // 1000
+            start_index = max(self.audio_bytes(speech['audio_start_ms']) - input_audio_offset, 0)
+            end_index = max(self.audio_bytes(speech['audio_end_ms']) - input_audio_offset, 0)
             speech['audio'] = input_audio_buffer[start_index:end_index]
         return None, None
 
@@ -324,6 +418,20 @@ class RealtimeConversation:
             self.responses.append(response)
         return None, None
 
+    def _process_response_done(self, event):
+        response = event['response']
+        known_response = self.response_lookup.get(response['id'])
+        if known_response:
+            known_response['status'] = response.get('status')
+            known_response['status_details'] = response.get('status_details')
+            known_response['usage'] = response.get('usage')
+        self.usage.record(usage_entry(response))
+        return None, None
+
+    def _process_rate_limits_updated(self, event):
+        self.usage.update_rate_limits(event['rate_limits'])
+        return None, None
+
     def _process_output_item_added(self, event):
         response_id = event['response_id']
         item = event['item']
@@ -341,6 +449,7 @@ class RealtimeConversation:
         if not found_item:
             raise Exception(f'response.output_item.done: Item "{item["id"]}" not found')
         found_item['status'] = item['status']
+        self._enforce_audio_budget()
         return found_item, None
 
     def _process_content_part_added(self, event):
@@ -374,6 +483,8 @@ class RealtimeConversation:
         array_buffer = base64_to_array_buffer(delta)
         append_values = array_buffer.tobytes()
         item['formatted']['audio'] += [append_values]
+        self.audio_store.add(item_id, len(append_values))
+        self._enforce_audio_budget()
         return item, {'audio': append_values}
 
     def _process_text_delta(self, event):
@@ -405,16 +516,28 @@ class RealtimeConversation:
         return item, None
 
 class RealtimeClient(RealtimeEventHandler):
-    def __init__(self, url=None, api_key=None):
+    text_modalities = ["text"]
+    audio_modalities = ["text", "audio"]
+    # with server VAD, appended audio outside of speech is only kept this long: enough for the
+    # speech_started event (and its prefix padding) to arrive and be sliced out of the buffer
+    input_audio_retain_ms = 5000
+
+    def __init__(self, url=None, api_key=None, transport=None):
         super().__init__()
+        self.default_server_vad_config = {
+            "type": "server_vad",
+            "threshold": 0.5,
+            "prefix_padding_ms": 300,
+            "silence_duration_ms": 200,
+        }
         self.default_session_config = {
-            "modalities": ["text", "audio"],
+            "modalities": list(self.audio_modalities),
             "instructions": "", # these will be set in app.py when RealtimeAudio client is instantiated
             "voice": "coral", # this is passed from the personalization file
             "input_audio_format": "pcm16",
             "output_audio_format": "pcm16",
             "input_audio_transcription": { "model": 'whisper-1' },
-            "turn_detection": { "type": 'server_vad' },
+            "turn_detection": self.default_server_vad_config,
             "tools": [],
             "tool_choice": "auto",
             "temperature": 0.8,
@@ -422,14 +545,10 @@ class RealtimeClient(RealtimeEventHandler):
         }
         self.session_config = {}
         self.transcription_models = [{"model": "whisper-1"}]
-        self.default_server_vad_config = {
-            "type": "server_vad",
-            "threshold": 0.5,
-            "prefix_padding_ms": 300,
-            "silence_duration_ms": 200,
-        }
-        self.realtime = RealtimeAPI(url, api_key)
+        self.realtime = RealtimeAPI(url, api_key, transport=transport)
         self.conversation = RealtimeConversation()
+        self.latency = TurnLatencyTracker(self)
+        self.reconnect_on_stall = os.getenv("REALTIME_RECONNECT_ON_STALL", "false").lower() == "true"
         self._reset_config()
         self._add_api_event_handlers()
 
@@ -439,9 +558,27 @@ class RealtimeClient(RealtimeEventHandler):
         self.session_created = False
         self.tools = {}
         self.session_config = self.default_session_config.copy()
-        self.input_audio_buffer = bytearray()
+        self._clear_input_audio()
         return True
 
+    def _clear_input_audio(self):
+        self.input_audio_buffer = bytearray()
+        self.input_audio_offset = 0  # bytes trimmed off the front of the buffer
+
+    def _trim_input_audio(self):
+        """
+        Bounds the input audio buffer in server VAD mode. It is not counted against the audio
+        budget of the conversation; outside of speech it holds at most `input_audio_retain_ms`
+        (trimmed once it is twice that, to keep appends cheap), during speech the current turn.
+        """
+        if self.get_turn_detection_type() is None or self.conversation.speech_in_progress():
+            return
+        retain = self.conversation.audio_bytes(self.input_audio_retain_ms)
+        if len(self.input_audio_buffer) > 2 * retain:
+            excess = len(self.input_audio_buffer) - retain
+            del self.input_audio_buffer[:excess]
+            self.input_audio_offset += excess
+
     def _add_api_event_handlers(self):
         self.realtime.on("client.*", self._log_event)
         self.realtime.on("server.*", self._log_event)
@@ -461,8 +598,17 @@ class RealtimeClient(RealtimeEventHandler):
         self.realtime.on("server.response.function_call_arguments.delta", self._process_event)
         self.realtime.on("server.response.function_call_arguments.done", self._on_function_call_arguments_done)
         self.realtime.on("server.response.output_item.done", self._on_output_item_done)
+        self.realtime.on("server.response.done", self._on_response_done)
+        self.realtime.on("server.rate_limits.updated", self._process_event)
+        self.realtime.on("server.response.created", self._mark_latency)
+        self.realtime.on("server.response.audio.delta", self._mark_latency)
+        self.realtime.on("server.response.text.delta", self._mark_latency)
+        self.realtime.on("stalled", self._on_stalled)
+        self.realtime.on("close", self._on_close)
 
     def _log_event(self, event):
+        if not self.event_handlers.get("realtime.event"):
+            return
         realtime_event = {
             "time": datetime.now(timezone.utc),
             "source": "client" if event["type"].startswith("client.") else "server",
@@ -470,6 +616,27 @@ class RealtimeClient(RealtimeEventHandler):
         }
         self.dispatch("realtime.event", realtime_event)
 
+    latency_stages = {
+        "response.created": "response_created",
+        "response.audio.delta": "first_audio_delta",
+        "response.text.delta": "first_text_delta",
+    }
+
+    def _mark_latency(self, event):
+        self.latency.mark(self.latency_stages[event["type"]])
+
+    async def _on_stalled(self, event):
+        self.dispatch("realtime.stalled", event)
+        if self.reconnect_on_stall:
+            logger.warning("⚠️ Reconnecting stalled realtime socket")
+            await self.reconnect()
+
+    def _on_close(self, event):
+        self.session_created = False
+        self.conversation.clear()
+        self._clear_input_audio()
+        self.dispatch("realtime.disconnected", {"reason": "closed", "code": event["code"], "close_reason": event["reason"]})
+
     def _on_session_created(self, event):
         self.session_created = True
     
@@ -496,7 +663,8 @@ class RealtimeClient(RealtimeEventHandler):
         self.dispatch("conversation.interrupted", event)
 
     def _on_speech_stopped(self, event):
-        self._process_event(event, self.input_audio_buffer)
+        self.latency.start_turn("voice")
+        self._process_event(event, self.input_audio_buffer, self.input_audio_offset)
 
     def _on_item_created(self, event):
         item, delta = self._process_event(event)
@@ -504,6 +672,11 @@ class RealtimeClient(RealtimeEventHandler):
         if item and item["status"] == "completed":
             self.dispatch("conversation.item.completed", {"item": item})
 
+    def _on_response_done(self, event):
+        self._process_event(event)
+        self.latency.finish_response()
+        self.dispatch("response.done", event)
+
     async def _on_output_item_done(self, event):
         item, delta = self._process_event(event)
         if item and item["status"] == "completed":
@@ -517,7 +690,10 @@ class RealtimeClient(RealtimeEventHandler):
             tool_config = self.tools.get(tool["name"])
             if not tool_config:
                 raise Exception(f'Tool "{tool["name"]}" has not been added')
+            self.latency.mark("tool_started")
+            started = time.perf_counter()
             result = await tool_config["handler"](**json_arguments)
+            self.latency.tool_finished(tool["name"], started)
             await self.realtime.send("conversation.item.create", {
                 "item": {
                     "type": "function_call_output",
@@ -539,6 +715,18 @@ class RealtimeClient(RealtimeEventHandler):
     def is_connected(self):
         return self.realtime.is_connected()
 
+    def get_usage(self):
+        return self.conversation.usage.snapshot()
+
+    def get_socket_stats(self):
+        return self.realtime.monitor.stats()
+
+    def memory_usage(self):
+        return {
+            **self.conversation.memory_usage(),
+            "input_audio_buffer_bytes": len(self.input_audio_buffer),
+        }
+
     def reset(self):
         self.disconnect()
         self.realtime.clear_event_handlers()
@@ -546,13 +734,48 @@ class RealtimeClient(RealtimeEventHandler):
         self._add_api_event_handlers()
         return True
 
-    async def connect(self):
+    async def connect(self, modalities=None):
+        """
+        Connects and sends the session config.
+        :param modalities: e.g. ["text"] for a text-only session; defaults to the session config
+        """
         if self.is_connected():
             raise Exception("Already connected, use .disconnect() first")
+        if modalities:
+            self.session_config["modalities"] = list(modalities)
         await self.realtime.connect()
         await self.update_session()
         return True
 
+    def is_audio_enabled(self):
+        return "audio" in self.session_config.get("modalities", [])
+
+    async def enable_audio(self):
+        """
+        Upgrades a text-only session to audio replies, keeping the conversation.
+        :return: False if audio was already enabled
+        """
+        if self.is_audio_enabled():
+            return False
+        await self.update_session(modalities=list(self.audio_modalities))
+        return True
+
+    async def reconnect(self):
+        """
+        Replaces the socket with a new one configured with the same session and tools.
+        The server-side conversation does not survive, so the local one and the input audio
+        are cleared too; listeners of `realtime.reconnected` reset what they built on them.
+        """
+        self.session_created = False
+        self.conversation.clear()
+        self._clear_input_audio()
+        if self.realtime.is_connected():
+            await self.realtime.disconnect()
+        await self.realtime.connect()
+        await self.update_session()
+        self.dispatch("realtime.reconnected", {})
+        return True
+
     async def wait_for_session_created(self):
         if not self.is_connected():
             raise Exception("Not connected, use .connect() first")
@@ -560,14 +783,20 @@ class RealtimeClient(RealtimeEventHandler):
             await asyncio.sleep(0.001)
         return True
 
-    async def disconnect(self):
+    async def disconnect(self, reason="client"):
         self.session_created = False
         self.conversation.clear()
+        self._clear_input_audio()
         if self.realtime.is_connected():
             await self.realtime.disconnect()
+            self.dispatch("realtime.disconnected", {"reason": reason})
+
+    def idle_seconds(self):
+        """Seconds since the last event was sent or received on the socket."""
+        return time.monotonic() - self.realtime.last_activity
 
     def get_turn_detection_type(self):
-        return self.session_config.get("turn_detection", {}).get("type")
+        return (self.session_config.get("turn_detection") or {}).get("type")
 
     async def add_tool(self, definition, handler):
         if not definition.get("name"):
@@ -605,14 +834,17 @@ class RealtimeClient(RealtimeEventHandler):
             await self.realtime.send("session.update", {"session": session})
         return True
     
-    async def create_conversation_item(self, item):
-        await self.realtime.send("conversation.item.create", {
-            "item": item
-        })
+    async def create_conversation_item(self, item, previous_item_id=None):
+        data = {"item": item}
+        if previous_item_id:
+            data["previous_item_id"] = previous_item_id
+        await self.realtime.send("conversation.item.create", data)
 
     async def send_user_message_content(self, content=[]):
         if content:
-            print(f"send_user_message_content:  {content}")
+            self.latency.start_turn("text")
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug(f"send_user_message_content:  {elide_payloads(content)}")
             for c in content:
                 if c["type"] == "input_audio":
                     if isinstance(c["audio"], (bytes, bytearray)):
@@ -633,13 +865,14 @@ class RealtimeClient(RealtimeEventHandler):
                 "audio": array_buffer_to_base64(np.array(array_buffer)),
             })
             self.input_audio_buffer.extend(array_buffer)
+            self._trim_input_audio()
         return True
 
     async def create_response(self):
         if self.get_turn_detection_type() is None and len(self.input_audio_buffer) > 0:
             await self.realtime.send("input_audio_buffer.commit")
             self.conversation.queue_input_audio(self.input_audio_buffer)
-            self.input_audio_buffer = bytearray()
+            self._clear_input_audio()
         await self.realtime.send("response.create")
         return True
 
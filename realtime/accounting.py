@@ -0,0 +1,109 @@
+import time
+from collections import defaultdict, deque
+
+from utils.metrics import registry
+
+TOKEN_FIELDS = (
+    "input_tokens",
+    "output_tokens",
+    "cached_tokens",
+    "input_text_tokens",
+    "input_audio_tokens",
+    "output_text_tokens",
+    "output_audio_tokens",
+)
+
+
+def usage_entry(response):
+    """
+    Flattens the usage block of a response.done event.
+    :param response: the `response` object of a response.done event
+    :return: dict with one key per TOKEN_FIELDS entry plus the response id and status
+    """
+    usage = response.get('usage') or {}
+    input_details = usage.get('input_token_details') or {}
+    output_details = usage.get('output_token_details') or {}
+    return {
+        "response_id": response.get('id'),
+        "status": response.get('status'),
+        "input_tokens": usage.get('input_tokens', 0),
+        "output_tokens": usage.get('output_tokens', 0),
+        "cached_tokens": input_details.get('cached_tokens', 0),
+        "input_text_tokens": input_details.get('text_tokens', 0),
+        "input_audio_tokens": input_details.get('audio_tokens', 0),
+        "output_text_tokens": output_details.get('text_tokens', 0),
+        "output_audio_tokens": output_details.get('audio_tokens', 0),
+    }
+
+tokens_total = registry.counter("realtime_tokens_total", "Tokens reported by realtime response.done events")
+responses_total = registry.counter("realtime_responses_total", "Realtime responses by final status")
+rate_limit_remaining = registry.gauge("realtime_rate_limit_remaining", "Last reported realtime rate-limit headroom")
+
+
+class UsageAccount:
+    """
+    Token usage and rate-limit headroom reported by the realtime server.
+
+    Every conversation owns one account whose parent is the process-wide `process_usage`,
+    so the same numbers can be read per session or for the whole worker.
+    """
+
+    def __init__(self, parent=None, history=100):
+        self.parent = parent
+        self.totals = defaultdict(int)
+        self.responses = deque(maxlen=history)
+        self.rate_limits = {}
+
+    def record(self, entry):
+        self.totals["responses"] += 1
+        for field in TOKEN_FIELDS:
+            self.totals[field] += entry[field]
+        self.responses.append(entry)
+        if self.parent:
+            self.parent.record(entry)
+        else:
+            responses_total.inc(status=entry["status"])
+            for field in TOKEN_FIELDS:
+                tokens_total.inc(entry[field], kind=field)
+
+    def update_rate_limits(self, rate_limits):
+        now = time.monotonic()
+        for rate_limit in rate_limits:
+            self.rate_limits[rate_limit['name']] = {**rate_limit, "updated_at": now}
+        if self.parent:
+            self.parent.update_rate_limits(rate_limits)
+        else:
+            for rate_limit in rate_limits:
+                rate_limit_remaining.set(rate_limit.get('remaining', 0), name=rate_limit['name'])
+
+    def remaining(self, name):
+        """
+        Returns what is left of the named rate limit ("requests" or "tokens"), or None if the
+        server never reported it. A limit whose reset time has passed is assumed replenished.
+        """
+        rate_limit = self.rate_limits.get(name)
+        if not rate_limit:
+            return None
+        if time.monotonic() - rate_limit["updated_at"] >= rate_limit.get("reset_seconds", 0):
+            return rate_limit.get("limit")
+        return rate_limit.get("remaining")
+
+    def has_headroom(self, min_requests=1, min_tokens=0):
+        remaining_requests = self.remaining("requests")
+        remaining_tokens = self.remaining("tokens")
+        if remaining_requests is not None and remaining_requests < min_requests:
+            return False
+        if remaining_tokens is not None and remaining_tokens < min_tokens:
+            return False
+        return True
+
+    def snapshot(self):
+        return {
+            **{field: self.totals[field] for field in ("responses",) + TOKEN_FIELDS},
+            "remaining_requests": self.remaining("requests"),
+            "remaining_tokens": self.remaining("tokens"),
+        }
+
+
+# Aggregates every session of this process
+process_usage = UsageAccount()
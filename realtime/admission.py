@@ -0,0 +1,111 @@
+import asyncio
+import contextvars
+import heapq
+import itertools
+import os
+import time
+
+from chainlit.logger import logger
+
+from utils.metrics import registry
+
+admission_wait = registry.histogram("realtime_admission_wait_seconds", "Time voice sessions waited for an admission slot")
+admission_timeouts = registry.counter("realtime_admission_timeouts_total", "Voice sessions that gave up waiting for an admission slot")
+
+
+class AdmissionController:
+    """
+    Limits the number of concurrent voice sessions of this process.
+
+    Up to `max_active` sessions (REALTIME_MAX_VOICE_SESSIONS, 0 for no limit) hold a slot;
+    later ones wait in a priority queue for at most `queue_timeout` seconds
+    (REALTIME_ADMISSION_TIMEOUT). Lower priority values are admitted first and equal
+    priorities in arrival order. When no priority is given, `priority_hook(session_id)` is
+    asked, if set. Waiters can pass an `on_position` coroutine function that is called with
+    their 1-based queue position whenever it changes, in the context of their own session.
+    """
+
+    def __init__(self, max_active=None, queue_timeout=None, priority_hook=None):
+        self.max_active = max_active if max_active is not None else int(os.getenv("REALTIME_MAX_VOICE_SESSIONS", "0"))
+        self.queue_timeout = queue_timeout if queue_timeout is not None else float(os.getenv("REALTIME_ADMISSION_TIMEOUT", "60"))
+        self.priority_hook = priority_hook
+        self.active = set()
+        self.waiters = []  # heap of [priority, seq, session_id, future, on_position, context, position]
+        self.sequence = itertools.count()
+        registry.gauge("realtime_voice_sessions_active", "Voice sessions holding an admission slot", callback=lambda: len(self.active))
+        registry.gauge("realtime_admission_queue_length", "Voice sessions waiting for an admission slot", callback=lambda: len(self.waiters))
+
+    def has_slot(self):
+        return self.max_active <= 0 or len(self.active) < self.max_active
+
+    async def acquire(self, session_id, priority=None, on_position=None):
+        """
+        Waits for a voice slot.
+        :param session_id: Chainlit session id; a session already holding a slot is admitted at once
+        :param priority: lower is admitted sooner; defaults to priority_hook(session_id) or 0
+        :param on_position: async callable receiving the queue position while waiting
+        :return: True once admitted, False on timeout
+        """
+        if session_id in self.active:
+            return True
+        if self.has_slot() and not self.waiters:
+            self.active.add(session_id)
+            admission_wait.observe(0)
+            return True
+        if priority is None:
+            priority = self.priority_hook(session_id) if self.priority_hook else 0
+        started = time.perf_counter()
+        future = asyncio.get_running_loop().create_future()
+        waiter = [priority, next(self.sequence), session_id, future, on_position, contextvars.copy_context(), None]
+        heapq.heappush(self.waiters, waiter)
+        self._notify_positions()
+        try:
+            await asyncio.wait_for(asyncio.shield(future), self.queue_timeout)
+        except asyncio.TimeoutError:
+            if not (future.done() and not future.cancelled()):
+                admission_timeouts.inc()
+                logger.warning(f"Voice session {session_id} not admitted within {self.queue_timeout}s")
+                return False
+        finally:
+            if not future.done():
+                future.cancel()
+            if waiter in self.waiters:
+                self.waiters.remove(waiter)
+                heapq.heapify(self.waiters)
+                self._notify_positions()
+        admission_wait.observe(time.perf_counter() - started)
+        return True
+
+    def release(self, session_id):
+        if session_id not in self.active:
+            return False
+        self.active.discard(session_id)
+        self._admit_waiters()
+        return True
+
+    def _admit_waiters(self):
+        while self.waiters and self.has_slot():
+            _, _, session_id, future, _, _, _ = heapq.heappop(self.waiters)
+            if future.done():
+                continue
+            self.active.add(session_id)
+            future.set_result(True)
+        self._notify_positions()
+
+    def _notify_positions(self):
+        loop = asyncio.get_running_loop()
+        for position, waiter in enumerate(sorted(self.waiters), start=1):
+            on_position, context = waiter[4], waiter[5]
+            if on_position and waiter[6] != position:
+                waiter[6] = position
+                loop.create_task(on_position(position), context=context)
+
+    def stats(self):
+        return {
+            "active": len(self.active),
+            "queued": len(self.waiters),
+            "max_active": self.max_active,
+        }
+
+
+admission = AdmissionController()
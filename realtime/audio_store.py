@@ -0,0 +1,161 @@
+import mmap
+import os
+import tempfile
+
+from chainlit.logger import logger
+
+
+def audio_nbytes(audio):
+    """
+    Returns the number of bytes a formatted audio value keeps in memory.
+    :param audio: list of byte chunks, bytes-like object or SpilledAudio
+    :return: int
+    """
+    if audio is None or isinstance(audio, SpilledAudio):
+        return 0
+    if isinstance(audio, (bytes, bytearray, memoryview)):
+        return len(audio)
+    return sum(len(chunk) for chunk in audio)
+
+
+class SpilledAudio:
+    """Read-only handle on item audio that was moved to the session spill file."""
+
+    def __init__(self, store, offset, length):
+        self.store = store
+        self.offset = offset
+        self.length = length
+
+    def __len__(self):
+        return self.length
+
+    def __getitem__(self, key):
+        return self.tobytes()[key]
+
+    def tobytes(self):
+        return self.store._read(self.offset, self.length)
+
+
+class AudioStore:
+    """
+    Keeps track of the audio held by a RealtimeConversation and enforces a memory budget.
+
+    Once the resident audio goes over the budget, the audio of the oldest completed items is
+    either spilled to a per-session temp file (read back through mmap) or dropped, depending
+    on the policy. Text and transcripts are never touched.
+    """
+
+    policies = ("spill", "drop")
+
+    def __init__(self, budget_bytes=None, policy=None, spill_dir=None):
+        if budget_bytes is None:
+            budget_bytes = int(float(os.getenv("REALTIME_AUDIO_BUDGET_MB", "0")) * 1024 * 1024)
+        self.budget_bytes = budget_bytes  # 0 means unlimited
+        self.policy = (policy or os.getenv("REALTIME_AUDIO_OVERFLOW_POLICY", "spill")).lower()
+        if self.policy not in self.policies:
+            raise ValueError(f'Unknown audio overflow policy "{self.policy}", expected one of {self.policies}')
+        self.spill_dir = spill_dir or os.getenv("REALTIME_AUDIO_SPILL_DIR") or None
+        self._file = None
+        self._mmap = None
+        self.reset()
+
+    def reset(self):
+        self.close()
+        self.sizes = {}
+        self.resident_bytes = 0
+        self.spilled_bytes = 0
+        self.dropped_bytes = 0
+
+    def close(self):
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def add(self, item_id, nbytes):
+        self.sizes[item_id] = self.sizes.get(item_id, 0) + nbytes
+        self.resident_bytes += nbytes
+
+    def account(self, item):
+        nbytes = audio_nbytes(item['formatted']['audio'])
+        self.resident_bytes += nbytes - self.sizes.get(item['id'], 0)
+        self.sizes[item['id']] = nbytes
+
+    def forget(self, item_id):
+        self.resident_bytes -= self.sizes.pop(item_id, 0)
+
+    def discard(self, item):
+        """Stops accounting for the audio of a deleted item, resident or spilled."""
+        self.forget(item['id'])
+        audio = item['formatted']['audio']
+        if isinstance(audio, SpilledAudio):
+            self.spilled_bytes -= audio.length
+
+    def truncate(self, item, end):
+        """
+        Cuts the audio of an item after `end` bytes. Spilled audio stays spilled, with a shorter length.
+        :param end: number of bytes to keep (pcm16 uses two bytes per sample)
+        """
+        audio = item['formatted']['audio']
+        end = max(end, 0)
+        if isinstance(audio, SpilledAudio):
+            length = min(end, audio.length)
+            self.spilled_bytes -= audio.length - length
+            item['formatted']['audio'] = SpilledAudio(self, audio.offset, length)
+        elif isinstance(audio, (bytes, bytearray, memoryview)):
+            item['formatted']['audio'] = audio[:end]
+            self.account(item)
+        else:
+            item['formatted']['audio'] = [b"".join(audio)[:end]] if audio else []
+            self.account(item)
+
+    def over_budget(self):
+        return self.budget_bytes > 0 and self.resident_bytes > self.budget_bytes
+
+    def enforce(self, items):
+        """Spills or drops the audio of the oldest completed items until back under budget."""
+        for item in items:
+            if not self.over_budget():
+                break
+            nbytes = self.sizes.get(item['id'], 0)
+            if not nbytes or item.get('status') != 'completed':
+                continue
+            if self.policy == "drop":
+                item['formatted']['audio'] = []
+                item['formatted']['audio_dropped'] = True
+                self.dropped_bytes += nbytes
+            else:
+                item['formatted']['audio'] = self._spill(item['formatted']['audio'])
+                self.spilled_bytes += nbytes
+            self.forget(item['id'])
+
+    def usage(self):
+        return {
+            "audio_budget_bytes": self.budget_bytes,
+            "audio_resident_bytes": self.resident_bytes,
+            "audio_spilled_bytes": self.spilled_bytes,  # still referenced by items
+            "audio_dropped_bytes": self.dropped_bytes,
+        }
+
+    def _spill(self, audio):
+        data = bytes(audio) if isinstance(audio, (bytes, bytearray, memoryview)) else b"".join(audio)
+        if self._file is None:
+            self._file = tempfile.TemporaryFile(prefix="realtime-audio-", dir=self.spill_dir)
+            logger.debug(f"Spilling realtime audio to {self._file.name}")
+        offset = self._file.seek(0, os.SEEK_END)
+        self._file.write(data)
+        return SpilledAudio(self, offset, len(data))
+
+    def _read(self, offset, length):
+        if self._file is None:
+            raise Exception("Spilled audio is no longer available")
+        if length == 0:
+            return b""
+        if self._mmap is None or len(self._mmap) < offset + length:
+            self._file.flush()
+            if self._mmap is not None:
+                self._mmap.close()
+            self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        return self._mmap[offset:offset + length]
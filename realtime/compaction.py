@@ -0,0 +1,142 @@
+import asyncio
+import os
+
+from chainlit.logger import logger
+from pydantic import BaseModel
+
+from utils.llm import structured_output_prompt
+from .tracing import generate_id
+from utils.utils import ModelName, model_name_to_id, env
+
+
+class ConversationSummaryResponse(BaseModel):
+    summary: str
+    model: ModelName
+
+
+async def summarize_turns(conversation_turns):
+    """
+    Summarises conversation turns with the fast model.
+    :param conversation_turns: plain text rendering of the turns to summarise
+    :return: summary text
+    """
+    compact_template = env.get_template("compact_conversation_prompt.xml")
+    compact_prompt = compact_template.render(conversation_turns=conversation_turns)
+    response = await structured_output_prompt(
+        compact_prompt, ConversationSummaryResponse, model_name_to_id[ModelName.fast_model]
+    )
+    return response.summary
+
+
+def format_item(item):
+    """
+    Renders a conversation item as a single line of text for the summary prompt.
+    :param item: conversation item
+    :return: str
+    """
+    formatted = item.get('formatted', {})
+    if item['type'] == 'message':
+        return f"{item['role']}: {formatted.get('text') or formatted.get('transcript') or ''}".strip()
+    if item['type'] == 'function_call':
+        return f"function call {item.get('name')}({item.get('arguments', '')})"
+    if item['type'] == 'function_call_output':
+        return f"function output: {item.get('output', '')[:1000]}"
+    return ""
+
+
+class ConversationCompactor:
+    """
+    Keeps the server-side context of a long realtime session bounded.
+
+    After each response, if the conversation has more than `max_items` items or the response
+    used more than `max_input_tokens` input tokens, the oldest completed turns are summarised
+    in the background, the summary is inserted as a system message and the originals are
+    deleted with `delete_item`. An earlier summary is folded into the new one and deleted too,
+    so the conversation holds at most one, and summaries do not count towards `max_items`.
+    The most recent `keep_recent` items are never compacted, nor are items that did not
+    complete (e.g. interrupted replies).
+    """
+
+    def __init__(self, client, summarize=summarize_turns, max_items=None, max_input_tokens=None, keep_recent=None):
+        self.client = client
+        self.summarize = summarize
+        self.max_items = max_items or int(os.getenv("REALTIME_COMPACTION_MAX_ITEMS", "40"))
+        self.max_input_tokens = max_input_tokens or int(os.getenv("REALTIME_COMPACTION_MAX_INPUT_TOKENS", "16000"))
+        self.keep_recent = keep_recent or int(os.getenv("REALTIME_COMPACTION_KEEP_RECENT", "6"))
+        self.task = None
+        self.compacted_ids = set()  # deleted by us, possibly not yet confirmed by the server
+        self.summary_ids = set()  # summaries inserted by us
+        self.last_input_tokens = None
+        self.input_tokens_before_compaction = None
+        self.tokens_saved_per_turn = 0
+        self.total_tokens_saved = 0
+        self.compactions = 0
+        self.client.on("response.done", self._on_response_done)
+
+    def _on_response_done(self, event):
+        usage = event.get('response', {}).get('usage') or {}
+        input_tokens = usage.get('input_tokens')
+        if input_tokens is not None:
+            if self.input_tokens_before_compaction is not None:
+                # first turn after a compaction: measure what it actually saved
+                saved = max(self.input_tokens_before_compaction - input_tokens, 0)
+                self.tokens_saved_per_turn += saved
+                self.input_tokens_before_compaction = None
+            self.last_input_tokens = input_tokens
+            if self.tokens_saved_per_turn:
+                self.total_tokens_saved += self.tokens_saved_per_turn
+                logger.info(
+                    f"🗜️ Compaction saved ~{self.tokens_saved_per_turn} input tokens this turn "
+                    f"({self.total_tokens_saved} total, {input_tokens} used)"
+                )
+        if self.task and not self.task.done():
+            return
+        remaining_items = [
+            i for i in self.client.conversation.items if i['id'] not in self.compacted_ids and i['id'] not in self.summary_ids
+        ]
+        too_many_items = len(remaining_items) > self.max_items
+        too_many_tokens = input_tokens is not None and input_tokens > self.max_input_tokens
+        if too_many_items or too_many_tokens:
+            self.task = asyncio.create_task(self.compact())
+
+    def _compactable_items(self):
+        """Completed items before the most recent ones, including earlier summaries to fold in."""
+        items = self.client.conversation.get_items()[:-self.keep_recent]
+        compactable = []
+        for item in items:
+            if item['id'] in self.compacted_ids:
+                continue
+            if item['id'] in self.summary_ids or item.get('status') == 'completed':
+                compactable.append(item)
+        return compactable
+
+    async def compact(self):
+        items = self._compactable_items()
+        if len([item for item in items if item['id'] not in self.summary_ids]) < 2:
+            return False
+        try:
+            # an earlier summary renders as a "system: Summary of the earlier conversation" turn
+            conversation_turns = "\n".join(line for line in map(format_item, items) if line)
+            summary = await self.summarize(conversation_turns)
+            if not self.client.is_connected():
+                return False
+            summary_id = generate_id("item_")
+            self.summary_ids.add(summary_id)
+            await self.client.create_conversation_item({
+                "id": summary_id,
+                "type": "message",
+                "role": "system",
+                "content": [{"type": "input_text", "text": f"Summary of the earlier conversation: {summary}"}],
+            }, previous_item_id=items[-1]['id'])
+            for item in items:
+                self.compacted_ids.add(item['id'])
+                self.summary_ids.discard(item['id'])
+                await self.client.delete_item(item['id'])
+        except Exception as e:
+            logger.error(f"❌ Conversation compaction failed: {e}")
+            return False
+        self.compactions += 1
+        self.input_tokens_before_compaction = self.last_input_tokens
+        logger.info(f"🗜️ Compacted {len(items)} conversation items into a summary")
+        self.client.dispatch("conversation.compacted", {"items": len(items), "summary": summary})
+        return True
@@ -0,0 +1,65 @@
+import hashlib
+import os
+from collections import defaultdict
+
+# (event type, field) pairs carrying base64 audio; None matches any event type
+PAYLOAD_FIELDS = {
+    ("response.audio.delta", "delta"),
+    (None, "audio"),
+}
+
+
+def describe_payload(payload):
+    """
+    Replaces a base64 payload with its decoded size and a short hash.
+    :param payload: base64 string
+    :return: str
+    """
+    digest = hashlib.blake2b(payload.encode("ascii", "replace"), digest_size=4).hexdigest()
+    return f"<{len(payload) * 3 // 4} bytes {digest}>"
+
+
+def elide_payloads(value, event_type=None):
+    """
+    Returns a copy of an event (or any part of one) with audio payloads replaced by their
+    size and hash, so it can be logged cheaply.
+    """
+    if isinstance(value, dict):
+        if event_type is None:
+            event_type = value.get("type")
+        return {
+            key: describe_payload(field)
+            if isinstance(field, str) and ((event_type, key) in PAYLOAD_FIELDS or (None, key) in PAYLOAD_FIELDS)
+            else elide_payloads(field, event_type)
+            for key, field in value.items()
+        }
+    if isinstance(value, list):
+        return [elide_payloads(field, event_type) for field in value]
+    return value
+
+
+class EventLogSampler:
+    """
+    Decides which events of a high-rate type get logged.
+
+    Rates come from REALTIME_LOG_SAMPLE as `type=N` pairs, e.g.
+    "response.audio.delta=50,input_audio_buffer.append=50", meaning one event in N is logged.
+    Types without a rate are always logged.
+    """
+
+    default_rates = "response.audio.delta=20,input_audio_buffer.append=20,response.audio_transcript.delta=5"
+
+    def __init__(self, rates=None):
+        rates = rates if rates is not None else os.getenv("REALTIME_LOG_SAMPLE", self.default_rates)
+        self.rates = {}
+        for pair in filter(None, (pair.strip() for pair in rates.split(","))):
+            event_type, _, rate = pair.partition("=")
+            self.rates[event_type.strip()] = max(int(rate), 1)
+        self.counts = defaultdict(int)
+
+    def should_log(self, event_type):
+        rate = self.rates.get(event_type)
+        if not rate:
+            return True
+        self.counts[event_type] += 1
+        return self.counts[event_type] % rate == 1 or rate == 1
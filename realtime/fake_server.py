@@ -0,0 +1,338 @@
+"""
+Local stand-in for the Realtime API, for benchmarks and regression runs without network.
+
+Speaks the subset of the protocol RealtimeClient uses: session.created/updated, server VAD
+speech events on appended audio, item create/delete/truncate, and response playback of
+recorded or synthetic event scripts at a configurable speed.
+
+    python -m realtime.fake_server --port 8765 --speed 2
+    OPENAI_REALTIME_URL=ws://127.0.0.1:8765 chainlit run app.py
+"""
+
+import argparse
+import asyncio
+import base64
+import itertools
+import json
+import os
+
+import websockets
+from chainlit.logger import logger
+
+from .tracing import generate_id
+
+ID_FIELDS = ("id", "item_id", "response_id", "call_id", "previous_item_id")
+
+
+def load_script(path):
+    """
+    Loads an event script: one server event per line, each with an optional `delay_ms`
+    (time since the previous event). Events are split into one script per response, from
+    response.created to response.done; anything outside a response is skipped.
+    :param path: JSONL file, e.g. written by realtime.recording.EventRecorder
+    :return: list of scripts, each a list of events
+    """
+    scripts, current = [], None
+    with open(path, "r", encoding="utf-8") as file:
+        for line in file:
+            if not line.strip():
+                continue
+            event = json.loads(line)
+            if event["type"] == "response.created":
+                current = []
+            if current is None:
+                continue
+            current.append(event)
+            if event["type"] == "response.done":
+                scripts.append(current)
+                current = None
+    return scripts
+
+
+def synthetic_response(audio_chunks=20, chunk_ms=100, transcript_words=30, sample_rate=24000, text_only=False, function_call=None, noise=False):
+    """
+    Builds the server events of one assistant response.
+    :param audio_chunks: number of response.audio.delta events
+    :param chunk_ms: audio per delta, also used as the delay between deltas
+    :param transcript_words: number of transcript (or text) deltas
+    :param sample_rate: pcm16 sample rate of the generated audio
+    :param text_only: stream response.text.delta instead of audio
+    :param function_call: optional (name, arguments) to reply with a function call instead
+    :param noise: fill the audio with random samples instead of silence (silence compresses unrealistically well)
+    :return: list of events
+    """
+    events = [{"type": "response.created", "response": {"id": "resp_1", "object": "realtime.response", "status": "in_progress", "output": []}}]
+    if function_call:
+        name, arguments = function_call
+        item = {"id": "item_1", "type": "function_call", "status": "in_progress", "name": name, "call_id": "call_1", "arguments": ""}
+        events += [
+            {"type": "response.output_item.added", "response_id": "resp_1", "output_index": 0, "item": item},
+            {"type": "conversation.item.created", "previous_item_id": None, "item": item},
+        ]
+        for i in range(0, len(arguments), 16):
+            events.append({"type": "response.function_call_arguments.delta", "response_id": "resp_1", "item_id": "item_1", "output_index": 0, "call_id": "call_1", "delta": arguments[i:i + 16], "delay_ms": 5})
+        events.append({"type": "response.function_call_arguments.done", "response_id": "resp_1", "item_id": "item_1", "output_index": 0, "call_id": "call_1", "arguments": arguments})
+        done_item = {**item, "status": "completed", "arguments": arguments}
+        usage = {"input_tokens": 500, "output_tokens": len(arguments) // 4 + 1, "input_token_details": {"text_tokens": 500}, "output_token_details": {"text_tokens": len(arguments) // 4 + 1}}
+    else:
+        part_type = "text" if text_only else "audio"
+        item = {"id": "item_1", "type": "message", "status": "in_progress", "role": "assistant", "content": []}
+        events += [
+            {"type": "response.output_item.added", "response_id": "resp_1", "output_index": 0, "item": item},
+            {"type": "conversation.item.created", "previous_item_id": None, "item": item},
+            {"type": "response.content_part.added", "response_id": "resp_1", "item_id": "item_1", "output_index": 0, "content_index": 0,
+             "part": {"type": part_type, "text": ""} if text_only else {"type": part_type, "transcript": ""}},
+        ]
+        words = [f"word{i} " for i in range(transcript_words)]
+        if text_only:
+            for word in words:
+                events.append({"type": "response.text.delta", "response_id": "resp_1", "item_id": "item_1", "output_index": 0, "content_index": 0, "delta": word, "delay_ms": 20})
+        else:
+            samples = sample_rate * 2 * chunk_ms // 1000
+            audio = base64.b64encode(os.urandom(samples) if noise else bytes(samples)).decode("utf-8")
+            for i in range(max(audio_chunks, len(words))):
+                if i < len(words):
+                    events.append({"type": "response.audio_transcript.delta", "response_id": "resp_1", "item_id": "item_1", "output_index": 0, "content_index": 0, "delta": words[i]})
+                if i < audio_chunks:
+                    events.append({"type": "response.audio.delta", "response_id": "resp_1", "item_id": "item_1", "output_index": 0, "content_index": 0, "delta": audio, "delay_ms": chunk_ms})
+            events.append({"type": "response.audio.done", "response_id": "resp_1", "item_id": "item_1", "output_index": 0, "content_index": 0})
+        done_item = {**item, "status": "completed"}
+        output_audio_tokens = 0 if text_only else audio_chunks * chunk_ms // 50
+        usage = {"input_tokens": 500, "output_tokens": transcript_words + output_audio_tokens, "input_token_details": {"text_tokens": 500},
+                 "output_token_details": {"text_tokens": transcript_words, "audio_tokens": output_audio_tokens}}
+    events += [
+        {"type": "response.output_item.done", "response_id": "resp_1", "output_index": 0, "item": done_item},
+        {"type": "response.done", "response": {"id": "resp_1", "object": "realtime.response", "status": "completed", "output": [done_item], "usage": usage}},
+    ]
+    return events
+
+
+class FakeRealtimeServer:
+    """
+    Serves the Realtime protocol on a local websocket.
+
+    Every response.create (or VAD-detected end of turn) plays the next script of `scripts`
+    in a loop, with fresh ids. `speed` scales the recorded delays; None plays as fast as
+    possible. Appended input audio is run through a trivial VAD that treats it as alternating
+    `vad_turn_ms` of speech and `vad_silence_ms` of silence.
+    """
+
+    def __init__(self, scripts=None, speed=1.0, host="127.0.0.1", port=0, vad_turn_ms=1000, vad_silence_ms=3000, sample_rate=24000, **serve_kwargs):
+        self.scripts = scripts or [synthetic_response()]
+        self.speed = speed
+        self.host = host
+        self.port = port
+        self.vad_turn_ms = vad_turn_ms
+        self.vad_silence_ms = vad_silence_ms
+        self.sample_rate = sample_rate
+        self.serve_kwargs = serve_kwargs
+        self.server = None
+        self.connections = 0
+        self.events_sent = 0
+        self.bytes_sent = 0
+
+    @property
+    def url(self):
+        return f"ws://{self.host}:{self.port}"
+
+    async def start(self):
+        self.server = await websockets.serve(self._handle, self.host, self.port, **self.serve_kwargs)
+        self.port = self.server.sockets[0].getsockname()[1]
+        logger.info(f"Fake realtime server listening on {self.url}")
+        return self
+
+    async def stop(self):
+        if self.server:
+            self.server.close()
+            await self.server.wait_closed()
+            self.server = None
+
+    async def __aenter__(self):
+        return await self.start()
+
+    async def __aexit__(self, *exc_info):
+        await self.stop()
+
+    async def _handle(self, ws):
+        self.connections += 1
+        session = _FakeSession(self, ws)
+        try:
+            await session.run()
+        except websockets.ConnectionClosed:
+            pass
+        finally:
+            session.cancel_response()
+            self.connections -= 1
+
+
+class _FakeSession:
+    def __init__(self, server, ws):
+        self.server = server
+        self.ws = ws
+        self.session = {
+            "id": generate_id("sess_"),
+            "object": "realtime.session",
+            "modalities": ["text", "audio"],
+            "turn_detection": {"type": "server_vad"},
+        }
+        self.item_ids = []
+        self.script_cycle = itertools.cycle(server.scripts)
+        self.response_task = None
+        self.audio_ms = 0
+        self.speech_item_id = None
+        self.speech_started_ms = 0
+        self.speech_stopped_ms = None
+
+    async def send(self, event):
+        message = json.dumps({"event_id": generate_id("event_"), **event})
+        self.server.events_sent += 1
+        self.server.bytes_sent += len(message)
+        await self.ws.send(message)
+
+    async def run(self):
+        await self.send({"type": "session.created", "session": self.session})
+        async for message in self.ws:
+            event = json.loads(message)
+            handler = getattr(self, "on_" + event["type"].replace(".", "_"), None)
+            if handler:
+                await handler(event)
+            else:
+                await self.error(event, f"Unsupported event type {event['type']}")
+
+    async def error(self, event, message):
+        await self.send({"type": "error", "error": {"type": "invalid_request_error", "message": message, "event_id": event.get("event_id")}})
+
+    async def add_item(self, item, previous_item_id=None):
+        """Adds an item after `previous_item_id` (the end of the conversation if None), like the real server."""
+        item = {"id": generate_id("item_"), "status": "completed", **item}
+        if previous_item_id:
+            self.item_ids.insert(self.item_ids.index(previous_item_id) + 1, item["id"])
+        else:
+            previous_item_id = self.item_ids[-1] if self.item_ids else None
+            self.item_ids.append(item["id"])
+        await self.send({"type": "conversation.item.created", "previous_item_id": previous_item_id, "item": item})
+        return item
+
+    async def on_session_update(self, event):
+        self.session.update(event.get("session", {}))
+        await self.send({"type": "session.updated", "session": self.session})
+
+    async def on_input_audio_buffer_append(self, event):
+        samples = len(base64.b64decode(event["audio"])) // 2
+        self.audio_ms += samples * 1000 // self.server.sample_rate
+        if (self.session.get("turn_detection") or {}).get("type") != "server_vad":
+            return
+        if not self.speech_item_id:
+            if self.speech_stopped_ms is not None and self.audio_ms - self.speech_stopped_ms < self.server.vad_silence_ms:
+                return
+            self.speech_item_id = generate_id("item_")
+            self.speech_started_ms = self.audio_ms
+            await self.send({"type": "input_audio_buffer.speech_started", "audio_start_ms": self.audio_ms, "item_id": self.speech_item_id})
+            self.cancel_response()
+        elif self.audio_ms - self.speech_started_ms >= self.server.vad_turn_ms:
+            item_id, self.speech_item_id = self.speech_item_id, None
+            self.speech_stopped_ms = self.audio_ms
+            await self.send({"type": "input_audio_buffer.speech_stopped", "audio_end_ms": self.audio_ms, "item_id": item_id})
+            await self.commit(item_id)
+            self.start_response()
+
+    async def commit(self, item_id=None):
+        item_id = item_id or generate_id("item_")
+        previous_item_id = self.item_ids[-1] if self.item_ids else None
+        await self.send({"type": "input_audio_buffer.committed", "previous_item_id": previous_item_id, "item_id": item_id})
+        await self.add_item({"id": item_id, "type": "message", "role": "user", "content": [{"type": "input_audio", "transcript": None}]})
+        await self.send({"type": "conversation.item.input_audio_transcription.completed", "item_id": item_id, "content_index": 0, "transcript": "synthetic user turn"})
+
+    async def on_input_audio_buffer_commit(self, event):
+        await self.commit()
+
+    async def on_input_audio_buffer_clear(self, event):
+        await self.send({"type": "input_audio_buffer.cleared"})
+
+    async def on_conversation_item_create(self, event):
+        previous_item_id = event.get("previous_item_id")
+        if previous_item_id and previous_item_id not in self.item_ids:
+            return await self.error(event, f"Item {previous_item_id} does not exist")
+        await self.add_item(event["item"], previous_item_id)
+
+    async def on_conversation_item_delete(self, event):
+        if event["item_id"] not in self.item_ids:
+            return await self.error(event, f"Item {event['item_id']} does not exist")
+        self.item_ids.remove(event["item_id"])
+        await self.send({"type": "conversation.item.deleted", "item_id": event["item_id"]})
+
+    async def on_conversation_item_truncate(self, event):
+        await self.send({"type": "conversation.item.truncated", "item_id": event["item_id"], "content_index": event["content_index"], "audio_end_ms": event["audio_end_ms"]})
+
+    async def on_response_create(self, event):
+        if self.response_task and not self.response_task.done():
+            return await self.error(event, "Conversation already has an active response")
+        self.start_response()
+
+    async def on_response_cancel(self, event):
+        if not self.cancel_response():
+            await self.error(event, "No active response to cancel")
+
+    def start_response(self):
+        self.response_task = asyncio.create_task(self.play(next(self.script_cycle)))
+
+    def cancel_response(self):
+        if self.response_task and not self.response_task.done():
+            self.response_task.cancel()
+            return True
+        return False
+
+    async def play(self, script):
+        ids = {}
+
+        def fresh_ids(value, key=None):
+            if isinstance(value, dict):
+                return {k: fresh_ids(v, k) for k, v in value.items()}
+            if isinstance(value, list):
+                return [fresh_ids(v) for v in value]
+            if key in ID_FIELDS and isinstance(value, str):
+                if value not in ids:
+                    ids[value] = generate_id(value.split("_", 1)[0] + "_")
+                return ids[value]
+            return value
+
+        response_id = None
+        try:
+            for event in script:
+                delay_ms = event.get("delay_ms", 0)
+                if delay_ms and self.server.speed:
+                    await asyncio.sleep(delay_ms / 1000 / self.server.speed)
+                event = fresh_ids({k: v for k, v in event.items() if k not in ("delay_ms", "event_id")})
+                if event["type"] == "response.created":
+                    response_id = event["response"]["id"]
+                elif event["type"] == "conversation.item.created":
+                    event["previous_item_id"] = self.item_ids[-1] if self.item_ids else None
+                    self.item_ids.append(event["item"]["id"])
+                await self.send(event)
+        except asyncio.CancelledError:
+            if response_id and not self.ws.closed:
+                await self.send({"type": "response.done", "response": {"id": response_id, "object": "realtime.response", "status": "cancelled", "output": []}})
+            raise
+
+
+async def serve(args):
+    scripts = load_script(args.script) if args.script else [synthetic_response(audio_chunks=args.audio_chunks)]
+    async with FakeRealtimeServer(scripts, speed=args.speed or None, host=args.host, port=args.port,
+                                  vad_turn_ms=args.vad_turn_ms, vad_silence_ms=args.vad_silence_ms):
+        await asyncio.Future()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local fake Realtime API server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--script", help="JSONL event script to replay (default: synthetic audio reply)")
+    parser.add_argument("--speed", type=float, default=1.0, help="playback speed multiplier, 0 for no delays")
+    parser.add_argument("--audio-chunks", type=int, default=20, help="audio deltas per synthetic reply")
+    parser.add_argument("--vad-turn-ms", type=int, default=1000, help="input audio per simulated user turn")
+    parser.add_argument("--vad-silence-ms", type=int, default=3000, help="input audio ignored as silence between turns")
+    asyncio.run(serve(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
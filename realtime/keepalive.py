@@ -0,0 +1,117 @@
+import asyncio
+import os
+import time
+from collections import deque
+
+from chainlit.logger import logger
+
+from utils.metrics import quantile, registry
+
+socket_rtt = registry.histogram("realtime_ws_rtt_seconds", "Ping/pong round-trip time of realtime sockets")
+socket_stalls = registry.counter("realtime_ws_stalls_total", "Active responses that received no server frame within the stall timeout")
+ping_timeouts = registry.counter("realtime_ws_ping_timeouts_total", "Pings of realtime sockets that got no pong in time")
+
+
+class SocketMonitor:
+    """
+    Watches the health of a RealtimeAPI socket while it is connected.
+
+    Every `ping_interval` seconds it sends a ping and records the pong round-trip time. While a
+    response is active (requested or created and not yet done) it also checks that server
+    frames keep arriving; after `stall_timeout` seconds of silence it dispatches `stalled` on
+    the RealtimeAPI, once per stall. A requested response that the server rejects with an
+    `error` is not active. Either interval can be disabled with 0.
+    """
+
+    def __init__(self, realtime, ping_interval=None, ping_timeout=None, stall_timeout=None, history=100):
+        self.realtime = realtime
+        self.ping_interval = ping_interval if ping_interval is not None else float(os.getenv("REALTIME_RTT_PING_INTERVAL", "10"))
+        self.ping_timeout = ping_timeout if ping_timeout is not None else float(os.getenv("REALTIME_RTT_PING_TIMEOUT", "10"))
+        self.stall_timeout = stall_timeout if stall_timeout is not None else float(os.getenv("REALTIME_STALL_TIMEOUT", "15"))
+        self.rtts = deque(maxlen=history)
+        self.stalls = 0
+        self.ping_timeouts = 0
+        self.tasks = []
+        self.reset()
+
+    def reset(self):
+        self.last_frame_at = time.monotonic()
+        self.response_active = False
+        self.response_created = False
+        self.stalled = False
+
+    def start(self):
+        self.stop()
+        self.reset()
+        if self.ping_interval > 0:
+            self.tasks.append(asyncio.create_task(self._ping_loop()))
+        if self.stall_timeout > 0:
+            self.tasks.append(asyncio.create_task(self._stall_loop()))
+
+    def stop(self):
+        for task in self.tasks:
+            task.cancel()
+        self.tasks = []
+
+    def response_requested(self):
+        if not self.response_active:
+            self.response_active = True
+            self.last_frame_at = time.monotonic()
+
+    def frame_received(self, event):
+        self.last_frame_at = time.monotonic()
+        self.stalled = False
+        if event['type'] == 'response.created':
+            self.response_active = True
+            self.response_created = True
+        elif event['type'] == 'response.done':
+            self.response_active = False
+            self.response_created = False
+        elif event['type'] == 'error' and not self.response_created:
+            # the response.create was rejected, so no response frames will follow
+            self.response_active = False
+
+    async def _ping_loop(self):
+        while True:
+            await asyncio.sleep(self.ping_interval)
+            ws = self.realtime.ws
+            if ws is None:
+                continue
+            try:
+                started = time.perf_counter()
+                pong_waiter = await ws.ping()
+                await asyncio.wait_for(pong_waiter, self.ping_timeout)
+            except asyncio.TimeoutError:
+                self.ping_timeouts += 1
+                ping_timeouts.inc()
+                logger.warning(f"⚠️ No pong from {self.realtime.url} within {self.ping_timeout}s")
+                continue
+            except Exception as e:
+                logger.debug(f"Realtime ping failed: {e}")
+                continue
+            rtt = time.perf_counter() - started
+            self.rtts.append(rtt)
+            socket_rtt.observe(rtt)
+
+    async def _stall_loop(self):
+        while True:
+            await asyncio.sleep(min(self.stall_timeout / 4, 1))
+            silence = time.monotonic() - self.last_frame_at
+            if self.response_active and not self.stalled and silence > self.stall_timeout:
+                self.stalled = True
+                self.stalls += 1
+                socket_stalls.inc()
+                logger.warning(f"⚠️ Realtime socket stalled: no server frames for {silence:.1f}s during an active response")
+                self.realtime.dispatch("stalled", {"silence_seconds": silence})
+
+    def stats(self):
+        rtts = sorted(self.rtts)
+        return {
+            "rtt_samples": len(rtts),
+            "rtt_last": self.rtts[-1] if self.rtts else None,
+            "rtt_p50": quantile(rtts, 0.5) if rtts else None,
+            "rtt_p95": quantile(rtts, 0.95) if rtts else None,
+            "rtt_max": rtts[-1] if rtts else None,
+            "ping_timeouts": self.ping_timeouts,
+            "stalls": self.stalls,
+        }
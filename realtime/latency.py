@@ -0,0 +1,62 @@
+import time
+
+from utils.metrics import registry
+
+turn_latency = registry.histogram(
+    "realtime_turn_latency_seconds",
+    "Time from the end of the user's turn to each stage of the assistant's reply",
+)
+tool_duration = registry.histogram(
+    "realtime_tool_duration_seconds",
+    "Duration of realtime tool calls",
+)
+
+
+class TurnLatencyTracker:
+    """
+    Timestamps the stages of each conversational turn of a RealtimeClient.
+
+    A turn starts when the server reports `speech_stopped` (or a typed message is sent) and
+    every later stage is measured from there: response created, first audio delta received,
+    first audio chunk sent to the browser, tool start/end and response done. Only the first
+    occurrence of a stage counts, so a turn that goes through a tool call reports the audio
+    of the follow-up response. Results go to the metrics registry and are dispatched on the
+    client as `turn.latency`.
+    """
+
+    def __init__(self, client):
+        self.client = client
+        self.turn_started = None
+        self.marks = {}
+        self.observed = set()
+
+    def start_turn(self, source):
+        self.turn_started = time.perf_counter()
+        self.source = source
+        self.marks = {}
+        self.observed = set()
+
+    def mark(self, stage):
+        if self.turn_started is not None and stage not in self.marks:
+            self.marks[stage] = time.perf_counter()
+
+    def tool_finished(self, name, started):
+        tool_duration.observe(time.perf_counter() - started, tool=name)
+        self.mark("tool_finished")
+
+    def finish_response(self):
+        self.mark("response_done")
+        if self.turn_started is None:
+            return None
+        latencies = {
+            stage: marked - self.turn_started
+            for stage, marked in self.marks.items()
+            if stage not in self.observed
+        }
+        for stage, seconds in latencies.items():
+            turn_latency.observe(seconds, stage=stage, source=self.source)
+        self.observed.update(latencies)
+        self.marks.pop("response_done")  # every response of the turn reports its own end
+        self.observed.discard("response_done")
+        self.client.dispatch("turn.latency", {"source": self.source, "latencies": latencies})
+        return latencies
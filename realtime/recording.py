@@ -0,0 +1,43 @@
+import json
+import os
+import time
+
+
+class EventRecorder:
+    """
+    Records the server events of a RealtimeAPI with their timing, in the script format
+    understood by realtime.fake_server.load_script.
+
+    Events are appended to `path` as they arrive instead of being kept in memory, so a long
+    session with audio costs a buffered file write per event, not its whole history.
+    """
+
+    def __init__(self, realtime, path):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.path = path
+        self.file = open(path, "w", encoding="utf-8")
+        self.last_at = None
+        self.events = 0
+        realtime.on("server.*", self._on_event)
+
+    def _on_event(self, event):
+        if self.file is None:
+            return
+        now = time.perf_counter()
+        delay_ms = 0 if self.last_at is None else round((now - self.last_at) * 1000, 1)
+        self.last_at = now
+        json.dump({**event, "delay_ms": delay_ms}, self.file)
+        self.file.write("\n")
+        self.events += 1
+
+    def flush(self):
+        """Writes out buffered events, so the file is complete up to now. Returns its path."""
+        if self.file is not None:
+            self.file.flush()
+        return self.path
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+        return self.path
@@ -0,0 +1,104 @@
+import asyncio
+import contextvars
+import os
+
+from chainlit.logger import logger
+
+from utils.metrics import registry
+
+sessions_reaped = registry.counter("realtime_sessions_reaped_total", "Realtime sockets closed by the idle reaper")
+connections_refused = registry.counter("realtime_connections_refused_total", "Realtime connections refused by the per-process cap")
+
+
+class SessionRegistry:
+    """
+    Tracks the RealtimeClient of every Chainlit session in this process.
+
+    Cleanup normally happens in on_chat_end/on_audio_end, but a killed browser tab does not
+    always trigger them. A background reaper therefore disconnects sockets that have seen no
+    event for `idle_timeout` seconds (REALTIME_IDLE_TIMEOUT), which also frees their
+    conversation audio, and forgets sessions that stay disconnected that long. `reserve`
+    enforces the per-process cap on open upstream sockets (REALTIME_MAX_CONNECTIONS, 0 for
+    no cap): a session claims its slot before it starts connecting, so concurrent connects
+    cannot overshoot the cap, and hands it back with `release` once its socket is open (and
+    counted) or the connect failed. Live sessions and open sockets are exported as gauges.
+
+    Each client is disconnected inside the context it was registered from, so handlers of
+    `realtime.disconnected` run in their own Chainlit session.
+    """
+
+    def __init__(self, idle_timeout=None, max_connections=None):
+        self.idle_timeout = idle_timeout if idle_timeout is not None else float(os.getenv("REALTIME_IDLE_TIMEOUT", "300"))
+        self.max_connections = max_connections if max_connections is not None else int(os.getenv("REALTIME_MAX_CONNECTIONS", "0"))
+        self.sessions = {}  # session id -> (client, context)
+        self.reserved = set()  # session ids holding a slot while they connect
+        self.reaper = None
+        registry.gauge("realtime_live_sessions", "Chainlit sessions holding a realtime client", callback=lambda: len(self.sessions))
+        registry.gauge("realtime_open_sockets", "Open upstream realtime sockets", callback=self.open_sockets)
+
+    def register(self, session_id, client):
+        self.sessions[session_id] = (client, contextvars.copy_context())
+        if self.idle_timeout > 0 and (self.reaper is None or self.reaper.done()):
+            # the reaper must not inherit the context of whichever session started it
+            self.reaper = asyncio.get_running_loop().create_task(self._reap_loop(), context=contextvars.Context())
+
+    def unregister(self, session_id):
+        self.sessions.pop(session_id, None)
+        self.reserved.discard(session_id)
+
+    def open_sockets(self):
+        return sum(
+            1 for session_id, (client, _) in self.sessions.items() if client.is_connected() and session_id not in self.reserved
+        )
+
+    def reserve(self, session_id):
+        """
+        Claims a connection slot for a session that is about to connect.
+        :return: False when the process is at its connection cap
+        """
+        if self.max_connections > 0 and self.open_sockets() + len(self.reserved - {session_id}) >= self.max_connections:
+            connections_refused.inc()
+            return False
+        self.reserved.add(session_id)
+        return True
+
+    def release(self, session_id):
+        """Returns the slot claimed by `reserve`; an open socket keeps counting through `open_sockets`."""
+        self.reserved.discard(session_id)
+
+    async def _reap_loop(self):
+        while self.sessions:
+            await asyncio.sleep(min(self.idle_timeout / 4, 30))
+            await self.reap()
+        self.reaper = None
+
+    async def reap(self):
+        """
+        Disconnects idle sockets and forgets idle disconnected sessions.
+        :return: number of sockets closed
+        """
+        closed = []
+        for session_id, (client, context) in list(self.sessions.items()):
+            if client.idle_seconds() < self.idle_timeout:
+                continue
+            if not client.is_connected():
+                self.unregister(session_id)
+                continue
+            logger.info(f"Closing realtime socket of session {session_id}, idle for {client.idle_seconds():.0f}s")
+            closed.append(asyncio.get_running_loop().create_task(client.disconnect(reason="idle"), context=context))
+        for result in await asyncio.gather(*closed, return_exceptions=True):
+            if isinstance(result, Exception):
+                logger.warning(f"Failed to close idle realtime socket: {result}")
+        sessions_reaped.inc(len(closed))
+        return len(closed)
+
+    def stats(self):
+        return {
+            "live_sessions": len(self.sessions),
+            "open_sockets": self.open_sockets(),
+            "connecting": len(self.reserved),
+            "max_connections": self.max_connections,
+        }
+
+
+sessions = SessionRegistry()
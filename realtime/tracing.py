@@ -0,0 +1,145 @@
+import itertools
+import json
+import os
+import time
+from collections import defaultdict, deque
+
+from utils.metrics import registry
+
+event_rtt = registry.histogram(
+    "realtime_event_rtt_seconds",
+    "Time from sending a client event to the server event acknowledging it",
+)
+
+_event_counter = itertools.count(1)
+_process_tag = os.urandom(3).hex()  # tells apart ids generated by different workers
+
+
+def generate_id(prefix):
+    """
+    Returns a unique, monotonically increasing id for this process.
+    :param prefix: id prefix, e.g. "evt_"
+    :return: str
+    """
+    return f"{prefix}{_process_tag}{next(_event_counter):012d}"
+
+
+# Client event type -> server event type that acknowledges it
+ACK_EVENTS = {
+    "session.update": "session.updated",
+    "input_audio_buffer.commit": "input_audio_buffer.committed",
+    "input_audio_buffer.clear": "input_audio_buffer.cleared",
+    "conversation.item.create": "conversation.item.created",
+    "conversation.item.truncate": "conversation.item.truncated",
+    "conversation.item.delete": "conversation.item.deleted",
+    "response.create": "response.created",
+    "response.cancel": "response.done",
+}
+
+
+def item_key(event):
+    """The item id that ties an item event to its acknowledgement, if the protocol carries one."""
+    if event["type"] in ("conversation.item.create", "conversation.item.created"):
+        return (event.get("item") or {}).get("id")
+    if event["type"] in ("conversation.item.truncate", "conversation.item.truncated", "conversation.item.delete", "conversation.item.deleted"):
+        return event.get("item_id")
+    return None
+
+
+class EventTracer:
+    """
+    Ring buffer of the events sent and received on a realtime socket.
+
+    Client events that the server acknowledges are matched to their reply and their round-trip
+    time is recorded on the trace and in the metrics registry. Errors are matched through the
+    `event_id` they echo, item events through the item id (RealtimeAPI gives every created item
+    one), and the rest in order. Server-initiated events are not acknowledgements and are left
+    unmatched: items the client did not create, the commit and response of a server VAD turn,
+    and responses that end without being cancelled.
+    """
+
+    def __init__(self, size=None):
+        size = size or int(os.getenv("REALTIME_TRACE_BUFFER_SIZE", "512"))
+        self.size = size
+        self.records = deque(maxlen=size)
+        self.pending = {}
+        self.awaiting = defaultdict(deque)  # reply type -> event ids, in order
+        self.awaiting_items = {}  # (reply type, item id) -> event id
+        self.server_turns = 0  # server VAD commits whose response.created is still to come
+
+    def sent(self, event):
+        record = {
+            "direction": "sent",
+            "event_id": event["event_id"],
+            "type": event["type"],
+            "at": time.time(),
+            "started": time.perf_counter(),
+        }
+        self.records.append(record)
+        reply_type = ACK_EVENTS.get(event["type"])
+        if reply_type:
+            self.pending[record["event_id"]] = record
+            key = item_key(event)
+            if key:
+                self.awaiting_items[(reply_type, key)] = record["event_id"]
+            else:
+                self.awaiting[reply_type].append(record["event_id"])
+            if len(self.pending) > self.size:
+                self.pending.pop(next(iter(self.pending)))
+            if len(self.awaiting_items) > self.size:
+                self.awaiting_items.pop(next(iter(self.awaiting_items)))
+
+    def received(self, event):
+        self.records.append({
+            "direction": "received",
+            "event_id": event.get("event_id"),
+            "type": event["type"],
+            "at": time.time(),
+        })
+        if event["type"] == "error":
+            record = self.pending.pop((event.get("error") or {}).get("event_id"), None)
+            if record:
+                self._complete(record, event)
+            return
+        key = item_key(event)
+        if key:
+            record = self.pending.pop(self.awaiting_items.pop((event["type"], key), None), None)
+            if record:
+                self._complete(record, event)
+            return
+        if event["type"] == "input_audio_buffer.speech_started":
+            # a new turn supersedes a server VAD turn whose response never started
+            self.server_turns = 0
+            return
+        if event["type"] == "response.created" and self.server_turns:
+            self.server_turns -= 1
+            return
+        if event["type"] == "response.done" and (event.get("response") or {}).get("status") != "cancelled":
+            return
+        if not self._complete_next(event) and event["type"] == "input_audio_buffer.committed":
+            self.server_turns += 1
+
+    def _complete_next(self, event):
+        awaiting = self.awaiting.get(event["type"])
+        while awaiting:
+            record = self.pending.pop(awaiting.popleft(), None)
+            if record:
+                self._complete(record, event)
+                return True
+        return False
+
+    def _complete(self, record, event):
+        record["rtt"] = time.perf_counter() - record["started"]
+        record["reply_type"] = event["type"]
+        record["reply_event_id"] = event.get("event_id")
+        event_rtt.observe(record["rtt"], type=record["type"])
+
+    def dump(self):
+        return [{k: v for k, v in record.items() if k != "started"} for record in self.records]
+
+    def dump_to_file(self, path):
+        with open(path, "w", encoding="utf-8") as file:
+            for record in self.dump():
+                json.dump(record, file)
+                file.write("\n")
+        return path
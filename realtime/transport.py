@@ -0,0 +1,37 @@
+import os
+
+# websockets.connect keyword -> (environment variable, parser)
+TRANSPORT_SETTINGS = {
+    "max_size": ("REALTIME_WS_MAX_SIZE", int),
+    "max_queue": ("REALTIME_WS_MAX_QUEUE", int),
+    "write_limit": ("REALTIME_WS_WRITE_LIMIT", int),
+    "compression": ("REALTIME_WS_COMPRESSION", str),
+    "ping_interval": ("REALTIME_WS_PING_INTERVAL", float),
+    "ping_timeout": ("REALTIME_WS_PING_TIMEOUT", float),
+    "close_timeout": ("REALTIME_WS_CLOSE_TIMEOUT", float),
+}
+
+
+def parse_transport_value(name, value):
+    """
+    Parses a transport setting; "none" disables the limit, or compression.
+    :param name: websockets.connect keyword
+    :param value: raw string value
+    :return: parsed value
+    """
+    if value.strip().lower() in ("none", "off"):
+        return None
+    return TRANSPORT_SETTINGS[name][1](value)
+
+
+def transport_config_from_env():
+    """
+    Returns the websockets.connect keywords set in the environment. Unset or empty settings
+    are left out so the websockets defaults apply.
+    """
+    transport = {}
+    for name, (variable, _) in TRANSPORT_SETTINGS.items():
+        value = os.getenv(variable)
+        if value:
+            transport[name] = parse_transport_value(name, value)
+    return transport
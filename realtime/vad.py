@@ -0,0 +1,95 @@
+import asyncio
+import os
+
+from chainlit.logger import logger
+
+from utils.metrics import registry
+
+false_turn_ends = registry.counter("realtime_vad_false_turn_ends_total", "User speech that resumed right after server VAD ended the turn")
+vad_adjustments = registry.counter("realtime_vad_adjustments_total", "Changes of the server VAD silence duration by the adaptive tuner")
+vad_silence = registry.histogram("realtime_vad_silence_duration_ms", "Server VAD silence duration in use when a voice turn completes")
+
+
+class AdaptiveVAD:
+    """
+    Tunes the server VAD `silence_duration_ms` of a RealtimeClient per session.
+
+    A short silence duration answers sooner but cuts the user off when they pause mid-sentence,
+    which shows up as a `speech_started` within `false_turn_gap_ms` of the previous
+    `speech_stopped`. Each such false turn-end raises the silence duration by `step_up_ms`.
+    When the last `calm_turns` voice turns had no false turn-end and the perceived end-of-turn
+    latency (silence duration plus time to the first audio delta) is above `target_latency_ms`,
+    it is lowered by `step_down_ms`. The value stays within [`min_silence_ms`, `max_silence_ms`]
+    and changes are sent with `update_session`.
+    """
+
+    def __init__(self, client, min_silence_ms=None, max_silence_ms=None, target_latency_ms=None,
+                 false_turn_gap_ms=None, step_up_ms=100, step_down_ms=50, calm_turns=3):
+        self.client = client
+        self.min_silence_ms = min_silence_ms or int(os.getenv("REALTIME_VAD_MIN_SILENCE_MS", "200"))
+        self.max_silence_ms = max_silence_ms or int(os.getenv("REALTIME_VAD_MAX_SILENCE_MS", "1200"))
+        self.target_latency_ms = target_latency_ms or int(os.getenv("REALTIME_VAD_TARGET_LATENCY_MS", "1000"))
+        self.false_turn_gap_ms = false_turn_gap_ms or int(os.getenv("REALTIME_VAD_FALSE_TURN_GAP_MS", "800"))
+        self.step_up_ms = step_up_ms
+        self.step_down_ms = step_down_ms
+        self.calm_turns = calm_turns
+        self.last_speech_end_ms = None
+        self.turns_since_false_end = 0
+        self.false_turn_ends = 0
+        self.adjustments = 0
+        self.client.realtime.on("server.input_audio_buffer.speech_started", self._on_speech_started)
+        self.client.realtime.on("server.input_audio_buffer.speech_stopped", self._on_speech_stopped)
+        self.client.on("turn.latency", self._on_turn_latency)
+
+    @property
+    def silence_ms(self):
+        turn_detection = self.client.session_config.get("turn_detection") or {}
+        return turn_detection.get("silence_duration_ms", self.client.default_server_vad_config["silence_duration_ms"])
+
+    def _on_speech_started(self, event):
+        # synchronous so that it sees speech events in order
+        gap = None
+        if self.last_speech_end_ms is not None:
+            gap = event["audio_start_ms"] - self.last_speech_end_ms
+        self.last_speech_end_ms = None
+        if gap is None or gap >= self.false_turn_gap_ms:
+            return
+        self.false_turn_ends += 1
+        self.turns_since_false_end = 0
+        false_turn_ends.inc()
+        asyncio.create_task(self.set_silence_ms(self.silence_ms + self.step_up_ms, f"speech resumed {gap} ms after turn end"))
+
+    def _on_speech_stopped(self, event):
+        self.last_speech_end_ms = event["audio_end_ms"]
+
+    async def _on_turn_latency(self, event):
+        first_audio = event["latencies"].get("first_audio_delta")
+        if event["source"] != "voice" or first_audio is None:
+            return
+        silence_ms = self.silence_ms
+        vad_silence.observe(silence_ms)
+        self.turns_since_false_end += 1
+        perceived_ms = silence_ms + first_audio * 1000
+        if self.turns_since_false_end >= self.calm_turns and perceived_ms > self.target_latency_ms:
+            self.turns_since_false_end = 0
+            await self.set_silence_ms(silence_ms - self.step_down_ms, f"end-of-turn latency {perceived_ms:.0f} ms")
+
+    async def set_silence_ms(self, silence_ms, reason):
+        silence_ms = min(max(silence_ms, self.min_silence_ms), self.max_silence_ms)
+        current = self.silence_ms
+        if silence_ms == current:
+            return False
+        turn_detection = {**(self.client.session_config.get("turn_detection") or self.client.default_server_vad_config)}
+        turn_detection["silence_duration_ms"] = silence_ms
+        self.adjustments += 1
+        vad_adjustments.inc(direction="up" if silence_ms > current else "down")
+        logger.info(f"VAD silence duration {current} -> {silence_ms} ms ({reason})")
+        await self.client.update_session(turn_detection=turn_detection)
+        return True
+
+    def stats(self):
+        return {
+            "silence_duration_ms": self.silence_ms,
+            "false_turn_ends": self.false_turn_ends,
+            "adjustments": self.adjustments,
+        }
@@ -0,0 +1,42 @@
+import base64
+
+from realtime import RealtimeConversation
+
+SAMPLE_RATE = RealtimeConversation.default_frequency
+
+
+def assistant_reply(conversation, item_id, audio_ms):
+    conversation.process_event({"type": "response.created", "response": {"id": "resp_1", "output": []}})
+    conversation.process_event({
+        "type": "conversation.item.created",
+        "item": {"id": item_id, "type": "message", "role": "assistant", "status": "in_progress", "content": []},
+    })
+    chunk = base64.b64encode(bytes(SAMPLE_RATE * 2 * 100 // 1000)).decode("utf-8")  # 100ms of pcm16
+    for _ in range(audio_ms // 100):
+        conversation.process_event({"type": "response.audio.delta", "item_id": item_id, "content_index": 0, "delta": chunk})
+    conversation.process_event({"type": "response.output_item.done", "item": {"id": item_id, "status": "completed"}})
+
+
+def truncate(conversation, item_id, audio_end_ms):
+    conversation.process_event({"type": "conversation.item.truncated", "item_id": item_id, "content_index": 0, "audio_end_ms": audio_end_ms})
+    return conversation.get_item(item_id)["formatted"]["audio"]
+
+
+def test_truncate_keeps_pcm16_bytes_of_resident_audio():
+    conversation = RealtimeConversation()
+    assistant_reply(conversation, "item_1", audio_ms=500)
+    audio = truncate(conversation, "item_1", audio_end_ms=250)
+    assert sum(len(chunk) for chunk in audio) == SAMPLE_RATE * 2 * 250 // 1000
+    assert conversation.audio_store.resident_bytes == SAMPLE_RATE * 2 * 250 // 1000
+
+
+def test_truncate_keeps_pcm16_bytes_of_spilled_audio():
+    conversation = RealtimeConversation()
+    conversation.audio_store.budget_bytes = 1
+    conversation.audio_store.policy = "spill"
+    assistant_reply(conversation, "item_1", audio_ms=500)
+    assert conversation.audio_store.spilled_bytes == SAMPLE_RATE * 2 * 500 // 1000
+    audio = truncate(conversation, "item_1", audio_end_ms=100)
+    assert len(audio) == len(audio.tobytes()) == SAMPLE_RATE * 2 * 100 // 1000
+    assert conversation.audio_store.spilled_bytes == SAMPLE_RATE * 2 * 100 // 1000
+    conversation.audio_store.close()
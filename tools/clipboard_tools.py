@@ -13,6 +13,7 @@ from dotenv import dotenv_values
 from jinja2 import Environment, FileSystemLoader
 from pydantic import BaseModel
 from utils.llm import structured_output_prompt
+from utils.search_index import index_file
 from chainlit.logger import logger
 
 config = dotenv_values(".env")
@@ -127,6 +128,7 @@ class ClipboardToFileTool(BaseTool):
             file_path = os.path.join(scratch_pad_dir, file_name)
             with open(file_path, "w") as file:
                 file.write(content)
+            index_file(scratch_pad_dir, file_name)
 
             return {
                 "status": "success",
@@ -1,5 +1,16 @@
+import asyncio
+import base64
+import difflib
+import html
+import json
 import os
-from utils.llm import structured_output_prompt, parse_markdown_backticks
+import time
+from datetime import datetime, timezone
+from typing import List, Optional, Tuple
+from utils.llm import structured_output_prompt, stream_structured_output_prompt, parse_markdown_backticks
+from utils.message_stream import ThrottledMessageStream
+from utils.file_matcher import file_matcher
+from utils.search_index import get_index, index_file, search_seconds, unindex_file
 from .base_tool import BaseTool
 from utils.utils import (
     ModelName,
@@ -18,6 +29,37 @@ PROMPT_DIR = "prompts"  # Directory where your XML templates are stored
 env = Environment(loader=FileSystemLoader(PROMPT_DIR), autoescape=True)
 
 
+async def stream_file_content(prompt: str, response_format: BaseModel, model_id: str, file_path: str):
+    """
+    Generates `file_content` with streaming: the text is shown in a chat message and written
+    to a `.partial` file next to `file_path` as it arrives, and `file_path` is replaced with
+    the final content only once the whole response is valid.
+    Returns the parsed response and the (still open) message stream.
+    """
+    stream = ThrottledMessageStream()
+    partial_path = f"{file_path}.partial"
+    try:
+        with open(partial_path, "w") as partial_file:
+            async def on_delta(text):
+                partial_file.write(text)
+                partial_file.flush()
+                await stream.append(text)
+
+            response = await stream_structured_output_prompt(
+                prompt, response_format, model_id, "file_content", on_delta
+            )
+            partial_file.seek(0)
+            partial_file.truncate()
+            partial_file.write(parse_markdown_backticks(response.file_content))
+        os.replace(partial_path, file_path)
+    except BaseException:
+        if os.path.exists(partial_path):
+            os.remove(partial_path)
+        await stream.close()
+        raise
+    return response, stream
+
+
 class CreateFileResponse(BaseModel):
     file_content: str
     file_name: str
@@ -81,15 +123,13 @@ class CreateFileTool(BaseTool):
             f"📝 Memory content used for create file prompt: {convert_escaped_html_to_xml(create_content_prompt)}"
         )
 
-        response = await structured_output_prompt(
-            create_content_prompt, CreateFileResponse, model_name_to_id[model]
+        # stream the content into the chat and the file while it is generated
+        response, stream = await stream_file_content(
+            create_content_prompt, CreateFileResponse, model_name_to_id[model], file_path
         )
 
         logger.info(f"✅ Create file used the model {response.model}")
 
-        with open(file_path, "w") as f:
-            f.write(parse_markdown_backticks(response.file_content))
-
         elements = [
             cl.File(
                 name=response.file_name,
@@ -98,7 +138,10 @@ class CreateFileTool(BaseTool):
             )
         ]
 
-        await cl.Message(content=response.file_content, elements=elements).send()
+        stream.message.elements = elements
+        await stream.close(content=response.file_content)
+        file_matcher.touch(file_name)
+        index_file(scratch_pad_dir, file_name)
         return {"status": "file created", "file_name": file_name}
 
 
@@ -142,30 +185,39 @@ class DeleteFileTool(BaseTool):
         os.makedirs(scratch_pad_dir, exist_ok=True)
 
         available_files = os.listdir(scratch_pad_dir)
-        select_prompt = f"""
-        Select a file to delete based on the following prompt:
-        {prompt}
-        Available files: {', '.join(available_files)}
-        """
-
-        response = await structured_output_prompt(
-            select_prompt, FileDeleteResponse, model_name_to_id[model]
-        )
+        # deleting the wrong file cannot be undone: only skip the LLM when the file is named exactly
+        selected_file = file_matcher.exact_match(prompt, available_files, tool="Delete")
+        if selected_file is None:
+            select_prompt = f"""
+            Select a file to delete based on the following prompt:
+            {prompt}
+            Available files: {', '.join(available_files)}
+            """
+
+            response = await structured_output_prompt(
+                select_prompt, FileDeleteResponse, model_name_to_id[model], cache=True
+            )
 
-        logger.info(f"✅ Delete file used the model {response.model}")
+            logger.info(f"✅ Delete file used the model {response.model}")
+            selected_file = response.file
+        else:
+            logger.info(f"✅ Delete file matched the file locally: {selected_file}")
 
-        if not response.file:
+        if not selected_file:
             return {"status": "No matching file found"}
 
-        file_path = os.path.join(scratch_pad_dir, response.file)
+        file_path = os.path.join(scratch_pad_dir, selected_file)
         if not os.path.exists(file_path):
             return {"status": "File does not exist"}
 
         if not force_delete:
-            return {"status": "Confirmation required", "file_name": response.file}
+            file_matcher.touch(selected_file)
+            return {"status": "Confirmation required", "file_name": selected_file}
 
         os.remove(file_path)
-        return {"status": f"File {response.file} deleted"}
+        file_matcher.forget(selected_file)
+        unindex_file(selected_file)
+        return {"status": f"File {selected_file} deleted"}
 
 
 class FileSelectionResponse(BaseModel):
@@ -173,12 +225,81 @@ class FileSelectionResponse(BaseModel):
     model: ModelName
 
 
+async def select_file(prompt: str, available_files: List[str], model: ModelName, tool: str) -> str:
+    """
+    Returns the file the user's prompt refers to, or an empty string if none matches.
+    Clear matches are resolved locally; only ambiguous prompts cost an LLM call.
+    """
+    selected_file = file_matcher.match(prompt, available_files, tool=tool)
+    if selected_file is not None:
+        logger.info(f"🍓 Select File to {tool} matched the file locally: {selected_file}")
+    else:
+        # Render select_file_prompt template
+        select_file_template = env.get_template("select_file_prompt.xml")
+        select_file_prompt = select_file_template.render(
+            available_files_str=", ".join(available_files), prompt=prompt
+        )
+
+        logger.info(f"🍓 Select file prompt: {select_file_prompt}")
+
+        # Call LLM to select a file
+        file_selection_response = await structured_output_prompt(
+            select_file_prompt, FileSelectionResponse, model_name_to_id[model], cache=True
+        )
+
+        logger.info(
+            f"🍓 Select File to {tool} found the file: {file_selection_response.file} with model {file_selection_response.model}"
+        )
+        selected_file = file_selection_response.file
+    if selected_file:
+        file_matcher.touch(selected_file)
+    return selected_file
+
+
 class FileUpdateResponse(BaseModel):
     file: str
     file_content: str
     model: ModelName
 
 
+class FileEdit(BaseModel):
+    search: str
+    replace: str
+
+
+class FileEditResponse(BaseModel):
+    file: str
+    edits: List[FileEdit]
+    model: ModelName
+
+
+def apply_edits(content: str, edits: List[FileEdit]) -> str:
+    """
+    Applies search/replace edits in order. Each search text must match exactly once in the
+    content as edited so far; otherwise nothing is applied and ValueError is raised.
+    """
+    for number, edit in enumerate(edits, start=1):
+        search, replace = edit.search, edit.replace
+        if not search:
+            raise ValueError(f"edit {number} has an empty search text")
+        matches = content.count(search)
+        if matches == 0 and html.unescape(search) != search:
+            # the prompt template escapes the file content, and models sometimes copy the entities
+            search, replace = html.unescape(search), html.unescape(replace)
+            matches = content.count(search)
+        if matches != 1:
+            raise ValueError(f"edit {number} search text matches {matches} times instead of once")
+        content = content.replace(search, replace, 1)
+    return content
+
+
+def write_file_atomically(file_path: str, content: str):
+    partial_path = f"{file_path}.partial"
+    with open(partial_path, "w") as f:
+        f.write(content)
+    os.replace(partial_path, file_path)
+
+
 class UpdateFileTool(BaseTool):
     def __init__(self):
         super().__init__(
@@ -217,30 +338,13 @@ class UpdateFileTool(BaseTool):
 
         # List available files
         available_files = os.listdir(scratch_pad_dir)
-        available_files_str = ", ".join(available_files)
-
-        # Render select_file_prompt template
-        select_file_template = env.get_template("select_file_prompt.xml")
-        select_file_prompt = select_file_template.render(
-            available_files_str=available_files_str, prompt=prompt
-        )
 
-        logger.info(f"🍓 Select file prompt: {select_file_prompt}")
-
-        # Call LLM to select a file
-        file_selection_response = await structured_output_prompt(
-            select_file_prompt, FileSelectionResponse, model_name_to_id[model]
-        )
-
-        logger.info(
-            f"🍓 Select File to Update found the file: {file_selection_response.file} with model {file_selection_response.model}"
-        )
+        selected_file = await select_file(prompt, available_files, model, "Update")
 
         # If no file is selected
-        if not file_selection_response.file:
+        if not selected_file:
             return {"status": "No matching file found"}
 
-        selected_file = file_selection_response.file
         file_path = os.path.join(scratch_pad_dir, selected_file)
 
         # Read the content of the selected file
@@ -250,6 +354,83 @@ class UpdateFileTool(BaseTool):
         # Get all memory content
         memory_content = memory_manager.get_xml_for_prompt(["*"])
 
+        # Edits keep the output (and so the latency) proportional to the change, not the file size
+        if os.getenv("UPDATE_FILE_MODE", "edit") == "edit":
+            try:
+                return await self.update_with_edits(
+                    scratch_pad_dir, selected_file, file_content, prompt, memory_content, model
+                )
+            except ValueError as e:
+                logger.warning(f"⚠️ Edits for {selected_file} could not be applied ({e}), rewriting the whole file")
+
+        return await self.update_with_rewrite(
+            scratch_pad_dir, selected_file, file_content, prompt, memory_content, model
+        )
+
+    async def update_with_edits(
+        self, scratch_pad_dir: str, selected_file: str, file_content: str, prompt: str, memory_content: str, model: ModelName
+    ) -> dict:
+        """
+        Asks the model for search/replace edits and applies them locally.
+        Raises ValueError if the edits do not apply cleanly.
+        """
+        file_path = os.path.join(scratch_pad_dir, selected_file)
+        edit_file_template = env.get_template("edit_file_prompt.xml")
+        edit_file_prompt = edit_file_template.render(
+            selected_file=selected_file,
+            file_content=file_content,
+            prompt=prompt,
+            memory_content=memory_content,
+        )
+
+        logger.info(f"🍓 Edit file prompt: {edit_file_prompt}")
+
+        file_edit_response = await structured_output_prompt(
+            edit_file_prompt, FileEditResponse, model_name_to_id[model]
+        )
+        updated_content = apply_edits(file_content, file_edit_response.edits)
+
+        logger.info(
+            f"✅ File Edit Response applied {len(file_edit_response.edits)} edits to file: {selected_file} using model: {file_edit_response.model}"
+        )
+
+        if updated_content == file_content:
+            return {"status": "No changes needed", "file_name": selected_file}
+
+        write_file_atomically(file_path, updated_content)
+        index_file(scratch_pad_dir, selected_file)
+
+        diff = "".join(
+            difflib.unified_diff(
+                file_content.splitlines(keepends=True),
+                updated_content.splitlines(keepends=True),
+                fromfile=selected_file,
+                tofile=selected_file,
+            )
+        )
+        elements = [
+            cl.File(
+                name=selected_file,
+                path=scratch_pad_dir + "/" + selected_file,
+                display="inline",
+            )
+        ]
+        await cl.Message(content=f"```diff\n{diff}\n```", elements=elements).send()
+
+        return {
+            "status": "File updated",
+            "file_name": selected_file,
+            "edits": len(file_edit_response.edits),
+        }
+
+    async def update_with_rewrite(
+        self, scratch_pad_dir: str, selected_file: str, file_content: str, prompt: str, memory_content: str, model: ModelName
+    ) -> dict:
+        """
+        Asks the model for the whole updated file, streaming it into the chat and the file.
+        """
+        file_path = os.path.join(scratch_pad_dir, selected_file)
+
         # Render update_file_prompt template
         update_file_template = env.get_template("update_file_prompt.xml")
         update_file_prompt = update_file_template.render(
@@ -261,19 +442,15 @@ class UpdateFileTool(BaseTool):
 
         logger.info(f"🍓 Update file prompt: {update_file_prompt}")
 
-        # Call LLM to generate file updates
-        file_update_response = await structured_output_prompt(
-            update_file_prompt, FileUpdateResponse, model_name_to_id[model]
+        # Call LLM to generate file updates, streaming them into the chat and the file
+        file_update_response, stream = await stream_file_content(
+            update_file_prompt, FileUpdateResponse, model_name_to_id[model], file_path
         )
 
         logger.info(
             f"✅ File Update Response updated file: {selected_file} using model: {file_update_response.model}"
         )
 
-        # Write the updated content to the file
-        with open(file_path, "w") as f:
-            f.write(parse_markdown_backticks(file_update_response.file_content))
-
         elements = [
             cl.File(
                 name=selected_file,
@@ -282,9 +459,9 @@ class UpdateFileTool(BaseTool):
             )
         ]
 
-        await cl.Message(
-            content=file_update_response.file_content, elements=elements
-        ).send()
+        stream.message.elements = elements
+        await stream.close(content=file_update_response.file_content)
+        index_file(scratch_pad_dir, selected_file)
 
         return {
             "status": "File updated",
@@ -292,11 +469,79 @@ class UpdateFileTool(BaseTool):
         }
 
 
+class FileSummaryResponse(BaseModel):
+    summary: str
+    model: ModelName
+
+
+def encode_continuation(file_name: str, offset: int, mtime_ns: int) -> str:
+    """Opaque token pointing into a file; it goes stale when the file changes."""
+    return base64.urlsafe_b64encode(json.dumps([file_name, offset, mtime_ns]).encode("utf-8")).decode("ascii")
+
+
+def decode_continuation(token: str) -> Tuple[str, int, int]:
+    try:
+        file_name, offset, mtime_ns = json.loads(base64.urlsafe_b64decode(token.encode("ascii")))
+        return str(file_name), int(offset), int(mtime_ns)
+    except (ValueError, TypeError) as e:
+        raise ValueError(f"invalid continuation token: {token}") from e
+
+
+def read_window(file_path: str, offset: int, max_bytes: int) -> Tuple[str, Optional[int]]:
+    """
+    Reads at most `max_bytes` bytes from `offset` without loading the rest of the file. The
+    window ends at the last line break when there is one, otherwise at the last UTF-8
+    character boundary, so neither lines nor characters are split.
+    Returns the text and the offset of the next window, or None at the end of the file.
+    """
+    with open(file_path, "rb") as f:
+        f.seek(offset)
+        data = f.read(max_bytes + 1)
+    if len(data) <= max_bytes:
+        return data.decode("utf-8", errors="replace"), None
+    line_end = data.rfind(b"\n", 0, max_bytes)
+    if line_end >= 0:
+        end = line_end + 1
+    else:
+        # the byte after the window must start a character, not continue one (0b10xxxxxx)
+        end = max_bytes
+        while end > 0 and data[end] & 0xC0 == 0x80:
+            end -= 1
+        if end == 0:
+            end = max_bytes  # window smaller than one character
+    return data[:end].decode("utf-8", errors="replace"), offset + end
+
+
+async def summarize_file(file_path: str, file_name: str, model: ModelName) -> str:
+    """
+    Summarises a large file from its start and end. The summary comes from the LLM response
+    cache while the file is unchanged: its modification time is part of the prompt, so any
+    write, including one in the unsampled middle, leads to a new summary.
+    """
+    sample_bytes = int(os.getenv("INGEST_SUMMARY_SAMPLE_BYTES", "40000"))
+    stat = os.stat(file_path)
+    file_size = stat.st_size
+    file_modified = datetime.fromtimestamp(stat.st_mtime_ns / 1e9, timezone.utc).isoformat()
+    file_start, _ = read_window(file_path, 0, sample_bytes // 2)
+    file_end = ""
+    if file_size > sample_bytes:
+        file_end, _ = read_window(file_path, file_size - sample_bytes // 2, sample_bytes // 2)
+    summarize_file_template = env.get_template("summarize_file_prompt.xml")
+    summarize_file_prompt = summarize_file_template.render(
+        file_name=file_name, file_size=file_size, file_modified=file_modified, file_start=file_start, file_end=file_end
+    )
+    response = await structured_output_prompt(
+        summarize_file_prompt, FileSummaryResponse, model_name_to_id[model], cache=True
+    )
+    logger.info(f"✅ Summarized file: {file_name} using model: {response.model}")
+    return response.summary
+
+
 class IngestFileTool(BaseTool):
     def __init__(self):
         super().__init__(
             name="ingest_file",
-            description="Selects a file based on the user's prompt, reads its content, and returns the file data.",
+            description="Selects a file based on the user's prompt, reads its content, and returns the file data. Large files are returned one window at a time: pass the returned continuation_token to read the next window, or set summarize to get a summary instead.",
             parameters={
                 "type": "object",
                 "properties": {
@@ -312,6 +557,14 @@ class IngestFileTool(BaseTool):
                         ],
                         "description": "The model to use for updating the file content. Defaults to 'base_model' if not explicitly specified.",
                     },
+                    "continuation_token": {
+                        "type": "string",
+                        "description": "The continuation_token returned by a previous ingest_file call, to read the next part of the same file.",
+                    },
+                    "summarize": {
+                        "type": "boolean",
+                        "description": "Return a summary of the file instead of its content when the file is too large to ingest at once.",
+                    },
                 },
                 "required": ["prompt"],
             },
@@ -319,56 +572,86 @@ class IngestFileTool(BaseTool):
 
     @timeit_decorator
     async def handle(
-        self, prompt: str, model: ModelName = ModelName.base_model
+        self,
+        prompt: str,
+        model: ModelName = ModelName.base_model,
+        continuation_token: Optional[str] = None,
+        summarize: bool = False,
     ) -> dict:
         """
         Selects a file based on the user's prompt, reads its content, and returns the file data.
+        At most INGEST_MAX_BYTES bytes are returned per call.
         """
         scratch_pad_dir = os.getenv("SCRATCH_PAD_DIR", "./scratchpad")
         os.makedirs(scratch_pad_dir, exist_ok=True)
-
-        # List available files
-        available_files = os.listdir(scratch_pad_dir)
-        available_files_str = ", ".join(available_files)
-
-        # Render select_file_prompt template
-        select_file_template = env.get_template("select_file_prompt.xml")
-        select_file_prompt = select_file_template.render(
-            available_files_str=available_files_str, prompt=prompt
-        )
-
-        logger.info(f"🍓 Select file prompt: {select_file_prompt}")
-
-        # Call LLM to select a file
-        file_selection_response = await structured_output_prompt(
-            select_file_prompt, FileSelectionResponse, model_name_to_id[model]
-        )
-
-        logger.info(
-            f"🍓 Select File to Ingest found the file: {file_selection_response.file} with model {file_selection_response.model}"
-        )
+        max_bytes = int(os.getenv("INGEST_MAX_BYTES", "20000"))
+
+        offset = 0
+        if continuation_token:
+            try:
+                selected_file, offset, mtime_ns = decode_continuation(continuation_token)
+                # the token comes back from the model, only accept files of the scratchpad
+                if selected_file not in os.listdir(scratch_pad_dir) or offset < 0:
+                    raise ValueError(f"invalid continuation token: {continuation_token}")
+            except ValueError as e:
+                return {
+                    "ingested_content": None,
+                    "message": str(e),
+                    "success": False,
+                }
+        else:
+            # List available files
+            available_files = os.listdir(scratch_pad_dir)
+
+            selected_file = await select_file(prompt, available_files, model, "Ingest")
 
         # If no file is selected
-        if not file_selection_response.file:
+        if not selected_file:
             return {
                 "ingested_content": None,
                 "message": "No matching file found for the given prompt.",
                 "success": False,
             }
 
-        file_path = os.path.join(scratch_pad_dir, file_selection_response.file)
+        file_path = os.path.join(scratch_pad_dir, selected_file)
 
         if not os.path.exists(file_path):
             return {
                 "ingested_content": None,
-                "message": f"File '{file_selection_response.file}' does not exist in '{scratch_pad_dir}'.",
+                "message": f"File '{selected_file}' does not exist in '{scratch_pad_dir}'.",
+                "success": False,
+            }
+
+        stat = os.stat(file_path)
+        if continuation_token and stat.st_mtime_ns != mtime_ns:
+            return {
+                "ingested_content": None,
+                "message": f"File '{selected_file}' changed since it was read, ingest it again from the start.",
                 "success": False,
             }
 
-        # Read the file content
+        if summarize and stat.st_size > max_bytes and not continuation_token:
+            try:
+                summary = await summarize_file(file_path, selected_file, model)
+            except Exception as e:
+                return {
+                    "ingested_content": None,
+                    "message": f"Failed to summarize the file: {str(e)}",
+                    "success": False,
+                }
+            return {
+                "ingested_content": None,
+                "summary": summary,
+                "file_name": selected_file,
+                "total_bytes": stat.st_size,
+                "continuation_token": encode_continuation(selected_file, 0, stat.st_mtime_ns),
+                "message": "The file is too large to ingest at once, returned a summary. Pass the continuation_token to read it from the start.",
+                "success": True,
+            }
+
+        # Read one window of the file content
         try:
-            with open(file_path, "r") as f:
-                file_content = f.read()
+            file_content, next_offset = read_window(file_path, offset, max_bytes)
         except Exception as e:
             return {
                 "ingested_content": None,
@@ -376,8 +659,63 @@ class IngestFileTool(BaseTool):
                 "success": False,
             }
 
-        return {
+        if offset == 0 and next_offset is None:
+            return {
+                "ingested_content": file_content,
+                "message": "Successfully ingested content",
+                "success": True,
+            }
+
+        result = {
             "ingested_content": file_content,
-            "message": "Successfully ingested content",
+            "file_name": selected_file,
+            "offset": offset,
+            "total_bytes": stat.st_size,
+            "message": f"Ingested bytes {offset} to {next_offset or stat.st_size} of {stat.st_size}.",
             "success": True,
         }
+        if next_offset is not None:
+            result["continuation_token"] = encode_continuation(selected_file, next_offset, stat.st_mtime_ns)
+            result["message"] += " Pass the continuation_token to read the next part."
+        return result
+
+
+class SearchFilesTool(BaseTool):
+    def __init__(self):
+        super().__init__(
+            name="search_files",
+            description="Searches the content of all files in the scratchpad and returns the best matching files with the relevant lines. Use it to find information in files instead of ingesting them whole.",
+            parameters={
+                "type": "object",
+                "properties": {
+                    "query": {
+                        "type": "string",
+                        "description": "Keywords describing the content to find.",
+                    },
+                    "limit": {
+                        "type": "integer",
+                        "description": "Maximum number of files to return. Defaults to 5.",
+                    },
+                },
+                "required": ["query"],
+            },
+        )
+
+    @timeit_decorator
+    async def handle(self, query: str, limit: int = 5) -> dict:
+        """
+        Ranks the scratchpad files against the query (BM25) and returns snippets of the best ones.
+        """
+        scratch_pad_dir = os.getenv("SCRATCH_PAD_DIR", "./scratchpad")
+        os.makedirs(scratch_pad_dir, exist_ok=True)
+
+        started = time.perf_counter()
+        # the incremental sync reads changed files, keep it off the event loop
+        results = await asyncio.to_thread(get_index().search, scratch_pad_dir, query, limit)
+        search_seconds.observe(time.perf_counter() - started)
+
+        logger.info(f"🔎 Search files found {len(results)} files for: {query}")
+
+        if not results:
+            return {"results": [], "message": "No file content matches the query."}
+        return {"results": results, "message": f"Found {len(results)} matching files."}
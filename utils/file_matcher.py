@@ -0,0 +1,118 @@
+import math
+import os
+import re
+import time
+from difflib import SequenceMatcher
+from typing import Dict, List, Optional
+
+from utils.metrics import registry
+
+match_requests = registry.counter("file_matcher_requests_total", "File selections by tool and result; result=local skipped the LLM selection call")
+
+_TOKEN = re.compile(r"[a-z0-9]+")
+
+
+def tokenize(text: str) -> List[str]:
+    return _TOKEN.findall(text.lower())
+
+
+class FileMatcher:
+    """
+    Picks the scratchpad file a prompt refers to without asking the LLM.
+
+    Every file name is scored against the prompt: 1.0 when the prompt contains the exact name,
+    otherwise a fuzzy match of the name's words against the prompt's words (so "my file" finds
+    "my_file.csv") plus a small weight for a matching extension. Files used recently get a boost
+    that halves every `recency_half_life` seconds. The best file is only returned when it scores
+    at least `min_score` (FILE_MATCH_MIN_SCORE) and beats the runner-up by `min_margin`
+    (FILE_MATCH_MIN_MARGIN); otherwise the caller asks the LLM.
+    """
+
+    extension_weight = 0.2
+    recency_weight = 0.1
+
+    def __init__(self, min_score: Optional[float] = None, min_margin: Optional[float] = None, recency_half_life: float = 600):
+        self.min_score = min_score if min_score is not None else float(os.getenv("FILE_MATCH_MIN_SCORE", "0.75"))
+        self.min_margin = min_margin if min_margin is not None else float(os.getenv("FILE_MATCH_MIN_MARGIN", "0.15"))
+        self.recency_half_life = recency_half_life
+        self.last_used: Dict[str, float] = {}
+
+    def touch(self, file_name: str):
+        """Records that a file was just created, selected or changed."""
+        self.last_used[file_name] = time.monotonic()
+
+    def forget(self, file_name: str):
+        self.last_used.pop(file_name, None)
+
+    def mentions(self, prompt: str, file_name: str) -> bool:
+        """True when the prompt contains the exact file name."""
+        return re.search(rf"(?<![\w.-]){re.escape(file_name.lower())}(?![\w-])", prompt.lower()) is not None
+
+    def name_score(self, prompt: str, file_name: str) -> float:
+        if self.mentions(prompt, file_name):
+            return 1.0
+        stem, extension = os.path.splitext(file_name.lower())
+        stem_tokens = tokenize(stem)
+        prompt_tokens = [token for token in tokenize(prompt) if len(token) > 1]
+        if not stem_tokens or not prompt_tokens:
+            return 0.0
+        # adjacent prompt words too, for names written as one word ("my file" -> "myfile")
+        candidates = set(prompt_tokens) | {a + b for a, b in zip(prompt_tokens, prompt_tokens[1:])}
+
+        def similarity(token):
+            return max(SequenceMatcher(None, token, candidate).ratio() for candidate in candidates)
+
+        per_token = sum(similarity(token) for token in stem_tokens) / len(stem_tokens)
+        stem_score = max(per_token, similarity("".join(stem_tokens)))
+        extension_match = 1.0 if extension.lstrip(".") in prompt_tokens else 0.0
+        return (1 - self.extension_weight) * stem_score + self.extension_weight * extension_match
+
+    def recency_score(self, file_name: str) -> float:
+        used = self.last_used.get(file_name)
+        if used is None:
+            return 0.0
+        return self.recency_weight * math.pow(0.5, (time.monotonic() - used) / self.recency_half_life)
+
+    def rank(self, prompt: str, files: List[str]) -> List[tuple]:
+        """(score, file) pairs, best first."""
+        scores = [(min(1.0, self.name_score(prompt, file) + self.recency_score(file)), file) for file in files]
+        return sorted(scores, reverse=True)
+
+    def match(self, prompt: str, files: List[str], tool: str = "unknown") -> Optional[str]:
+        """
+        Returns the file the prompt clearly refers to, or None when the LLM should decide.
+        :param tool: name of the calling tool, for the hit-rate metric
+        """
+        ranked = self.rank(prompt, files)
+        if ranked:
+            best_score, best_file = ranked[0]
+            runner_up = ranked[1][0] if len(ranked) > 1 else 0.0
+            if best_score >= self.min_score and best_score - runner_up >= self.min_margin:
+                match_requests.inc(tool=tool, result="local")
+                return best_file
+        match_requests.inc(tool=tool, result="llm")
+        return None
+
+    def exact_match(self, prompt: str, files: List[str], tool: str = "unknown") -> Optional[str]:
+        """
+        Like `match`, but only for a prompt naming exactly one file verbatim, with no fuzzy
+        matching or recency. For destructive operations, where a near miss is not acceptable.
+        """
+        named = [file for file in files if self.mentions(prompt, file)]
+        if len(named) == 1:
+            match_requests.inc(tool=tool, result="local")
+            return named[0]
+        match_requests.inc(tool=tool, result="llm")
+        return None
+
+    def stats(self) -> dict:
+        local = sum(value for key, value in match_requests.values.items() if ("result", "local") in key)
+        total = sum(match_requests.values.values())
+        return {
+            "local": local,
+            "llm": total - local,
+            "hit_rate": local / total if total else None,
+        }
+
+
+file_matcher = FileMatcher()
@@ -1,6 +1,9 @@
-from typing import Tuple
+import json
+from typing import Awaitable, Callable, Optional, Tuple
 
-from openai import RateLimitError, AsyncOpenAI
+import httpx
+import jiter
+from openai import RateLimitError, AsyncOpenAI, DefaultAsyncHttpxClient
 from pydantic import BaseModel, ValidationError
 from dotenv import dotenv_values
 from openai import OpenAIError
@@ -8,13 +11,117 @@ from markitdown import MarkItDown
 
 import backoff
 
+from utils.metrics import registry
+from utils.rate_limiter import estimate_tokens, scheduler
+from utils.llm_cache import get_cache
+from utils.singleflight import SingleFlight, request_key
+
 # Load environment variables
 config = dotenv_values(".env")
 
+http_requests = registry.counter("openai_http_requests_total", "HTTP requests sent by the shared OpenAI client")
+http_connections = registry.counter("openai_http_connections_opened_total", "New TCP connections opened by the shared OpenAI client")
+tls_handshakes = registry.counter("openai_tls_handshakes_total", "TLS handshakes performed by the shared OpenAI client")
+
+_client: Optional[AsyncOpenAI] = None
+
+
+async def _trace_connection(event_name: str, info: dict):
+    if event_name == "connection.connect_tcp.complete":
+        http_connections.inc()
+    elif event_name == "connection.start_tls.complete":
+        tls_handshakes.inc()
+
+
+async def _trace_request(request: httpx.Request):
+    http_requests.inc()
+    request.extensions["trace"] = _trace_connection
+
+
+def get_client() -> AsyncOpenAI:
+    """
+    Return the process-wide AsyncOpenAI client, creating it on first use.
+
+    All calls share one HTTP connection pool, so repeated tool calls reuse warm keep-alive
+    connections instead of paying for a new pool and TLS handshake each time. The pool is sized
+    by OPENAI_MAX_CONNECTIONS, OPENAI_MAX_KEEPALIVE_CONNECTIONS and OPENAI_KEEPALIVE_EXPIRY.
+
+    Raises:
+        ValueError: If OPENAI_API_KEY is not set.
+    """
+    global _client
+    if _client is None:
+        api_key = config.get("OPENAI_API_KEY")
+        if not api_key:
+            raise ValueError("OPENAI_API_KEY environment variable not found or empty.")
+        limits = httpx.Limits(
+            max_connections=int(config.get("OPENAI_MAX_CONNECTIONS") or 20),
+            max_keepalive_connections=int(config.get("OPENAI_MAX_KEEPALIVE_CONNECTIONS") or 10),
+            keepalive_expiry=float(config.get("OPENAI_KEEPALIVE_EXPIRY") or 60),
+        )
+        http_client = DefaultAsyncHttpxClient(limits=limits, event_hooks={"request": [_trace_request]})
+        _client = AsyncOpenAI(api_key=api_key, http_client=http_client)
+    return _client
+
+
+async def close_client():
+    """Close the shared client and its connections; the next get_client() creates a new one."""
+    global _client
+    if _client is not None:
+        client, _client = _client, None
+        await client.close()
+
+
+def connection_stats() -> dict:
+    """Requests sent and connections opened by the shared client, and the share of requests that reused one."""
+    requests = http_requests.get()
+    connections = http_connections.get()
+    return {
+        "requests": requests,
+        "connections_opened": connections,
+        "tls_handshakes": tls_handshakes.get(),
+        "reuse_ratio": 1 - connections / requests if requests else None,
+    }
+
+structured_output_flights = SingleFlight("structured_output_prompt")
+describe_image_flights = SingleFlight("describe_image_prompt")
+
+
+async def structured_output_prompt(
+    prompt: str, response_format: BaseModel, model: str, cache: bool = False
+) -> Tuple[BaseModel, str]:
+    """
+    Parse the response from the OpenAI API using structured output.
+
+    Identical concurrent calls (same prompt, model and response format) share one request.
+
+    Args:
+        prompt (str): The prompt to send to the OpenAI API.
+        response_format (BaseModel): The Pydantic model representing the expected response format.
+        model (str): The model ID to use for the API call.
+        cache (bool): Answer from, and store in, the on-disk response cache. Only for prompts
+            whose answer depends on nothing but the prompt text.
+
+    Returns:
+        BaseModel: The parsed response, with `model` set to the model that answered.
+    """
+    key = request_key(prompt, model, response_format.model_json_schema())
+    if cache:
+        cached = get_cache().get(key)
+        if cached is not None:
+            entry = json.loads(cached)
+            parsed = response_format.model_validate_json(entry["content"])
+            parsed.model = entry["model"]
+            return parsed
+    return await structured_output_flights.do(
+        key, lambda: _structured_output_prompt(prompt, response_format, model, cache_key=key if cache else None)
+    )
+
+
 ###  OpenAI chat completions call with backoff for rate limits and structured outputs
 @backoff.on_exception(backoff.expo, RateLimitError, max_tries=5)
-async def structured_output_prompt(
-    prompt: str, response_format: BaseModel, model: str
+async def _structured_output_prompt(
+    prompt: str, response_format: BaseModel, model: str, cache_key: Optional[str] = None
 ) -> Tuple[BaseModel, str]:
     """
     Parse the response from the OpenAI API using structured output.
@@ -31,21 +138,22 @@ async def structured_output_prompt(
         ValueError: If the response cannot be parsed into the given response_format.
         OpenAIError: If there's an error from the OpenAI API.
     """
-    api_key = config.get("OPENAI_API_KEY")
-    if not api_key:
-        raise ValueError("OPENAI_API_KEY environment variable not found or empty.")
-    
-    # setup the OpenAI Client
-    client = AsyncOpenAI(api_key=api_key)
+    # shared OpenAI client
+    client = get_client()
 
     try:
-        # Using a hypothetical beta parse method as provided in original code snippet.
-        # Adjust this call to the actual method available in your environment.
-        completion = await client.beta.chat.completions.parse(
-            model=model,
-            messages=[{"role": "user", "content": prompt}],
-            response_format=response_format
-        )
+        # paced by the process-wide scheduler; the raw response carries the rate-limit headers
+        async with scheduler.slot(model, estimate_tokens(prompt)):
+            raw_response = await client.beta.chat.completions.with_raw_response.parse(
+                model=model,
+                messages=[{"role": "user", "content": prompt}],
+                response_format=response_format
+            )
+        scheduler.observe_headers(model, raw_response.headers)
+        completion = raw_response.parse()
+    except RateLimitError as e:
+        scheduler.rate_limited(model, e.response.headers)
+        raise  # retried by backoff
     except OpenAIError as e:
         raise OpenAIError(f"OpenAI API error: {e}") from e
     
@@ -66,6 +174,75 @@ async def structured_output_prompt(
     except (ValidationError, ValueError) as e:
         raise ValueError(f"Failed to parse response into the given response_format: {e}") from e
 
+    if cache_key:
+        get_cache().set(cache_key, json.dumps({"content": content.content, "model": completion.model}))
+
+    return parsed
+
+
+###  Streaming variant of structured_output_prompt for long string fields
+@backoff.on_exception(backoff.expo, RateLimitError, max_tries=5)
+async def stream_structured_output_prompt(
+    prompt: str,
+    response_format: BaseModel,
+    model: str,
+    field: str,
+    on_delta: Callable[[str], Awaitable[None]],
+) -> BaseModel:
+    """
+    Like structured_output_prompt, but streams one string field while the JSON arrives.
+
+    The partial JSON is re-parsed on every chunk (keeping the unterminated trailing string),
+    and each new piece of `field` is passed to `on_delta`. The final object is validated
+    against `response_format` as usual.
+
+    Args:
+        prompt (str): The prompt to send to the OpenAI API.
+        response_format (BaseModel): The Pydantic model representing the expected response format.
+        model (str): The model ID to use for the API call.
+        field (str): Name of the string field to stream, e.g. "file_content".
+        on_delta (Callable): Coroutine function called with each new piece of the field.
+
+    Returns:
+        BaseModel: The parsed response, with `model` set to the model that answered.
+
+    Raises:
+        ValueError: If the response cannot be parsed into the given response_format.
+        OpenAIError: If there's an error from the OpenAI API.
+    """
+    client = get_client()
+    streamed = 0
+
+    try:
+        async with scheduler.slot(model, estimate_tokens(prompt)):
+            async with client.beta.chat.completions.stream(
+                model=model,
+                messages=[{"role": "user", "content": prompt}],
+                response_format=response_format,
+            ) as stream:
+                async for event in stream:
+                    if event.type != "content.delta" or not event.snapshot.strip():
+                        continue
+                    try:
+                        partial = jiter.from_json(event.snapshot.encode("utf-8"), partial_mode="trailing-strings")
+                    except ValueError:
+                        continue  # e.g. cut inside a key or number
+                    value = partial.get(field) if isinstance(partial, dict) else None
+                    if isinstance(value, str) and len(value) > streamed:
+                        await on_delta(value[streamed:])
+                        streamed = len(value)
+                completion = await stream.get_final_completion()
+    except RateLimitError as e:
+        scheduler.rate_limited(model, e.response.headers)
+        raise  # retried by backoff
+    except OpenAIError as e:
+        raise OpenAIError(f"OpenAI API error: {e}") from e
+
+    if not completion.choices or not completion.choices[0].message.parsed:
+        raise ValueError("No response message found in completion.")
+
+    parsed = completion.choices[0].message.parsed
+    parsed.model = completion.model  # same as structured_output_prompt
     return parsed
 
 
@@ -79,11 +256,7 @@ def model_predictive_prompt(prompt: str) -> str:
     Returns:
         str: The selected model name.
     """
-    api_key = config.get("OPENAI_API_KEY")
-    if not api_key:
-        raise ValueError("OPENAI_API_KEY environment variable not found or empty.")
-
-    client = AsyncOpenAI(api_key=api_key)
+    client = get_client()
 
     model_choices = """
         ModelName.state_of_the_art_model: 'o1',
@@ -130,11 +303,7 @@ async def generate_image_prompt(prompt: str, model: str) -> str:
     Returns:
         str: The URL of the generated image.
     """
-    api_key = config.get("OPENAI_API_KEY")
-    if not api_key:
-        raise ValueError("OPENAI_API_KEY environment variable not found or empty.")
-
-    client = AsyncOpenAI(api_key=api_key)
+    client = get_client()
 
     try:
         # This assumes the openai Python library supports `openai.Image.create` or similar.
@@ -158,6 +327,8 @@ async def describe_image_prompt(prompt: str, image_url: str, model: str) -> str:
     """
     Call a model to describe an image by providing an image URL and a prompt.
 
+    Identical concurrent calls (same prompt, image and model) share one request.
+
     Args:
         prompt (str): The prompt for the model.
         image_url (str): The URL of the image to describe.
@@ -166,35 +337,54 @@ async def describe_image_prompt(prompt: str, image_url: str, model: str) -> str:
     Returns:
         str: The assistant's description of the image.
     """
-    api_key = config.get("OPENAI_API_KEY")
-    if not api_key:
-        raise ValueError("OPENAI_API_KEY environment variable not found or empty.")
+    key = request_key(prompt, image_url, model)
+    return await describe_image_flights.do(key, lambda: _describe_image_prompt(prompt, image_url, model))
 
-    client = AsyncOpenAI(api_key=api_key)
+
+@backoff.on_exception(backoff.expo, RateLimitError, max_tries=5)
+async def _describe_image_prompt(prompt: str, image_url: str, model: str) -> str:
+    """
+    Call a model to describe an image by providing an image URL and a prompt.
+
+    Args:
+        prompt (str): The prompt for the model.
+        image_url (str): The URL of the image to describe.
+        model (str): The model ID to use for the API call.
+
+    Returns:
+        str: The assistant's description of the image.
+    """
+    client = get_client()
 
     # Assuming the API supports sending image URLs in the request.
     # Adjust according to actual API specifications.
     try:
-        response = await client.chat.completions.create(
-    model=model,
-    messages=[
-        {
-        "role": "user",
-        "content": [
-            {
-            "type": "text",
-            "text": prompt,
-            },
-            {
-            "type": "image_url",
-            "image_url": {
-                "url":  image_url,
-            },
-            },
-        ],
-        }
-    ],
-    )
+        async with scheduler.slot(model, estimate_tokens(prompt, max_output_tokens=2000)):  # image input plus output
+            raw_response = await client.chat.completions.with_raw_response.create(
+                model=model,
+                messages=[
+                    {
+                        "role": "user",
+                        "content": [
+                            {
+                                "type": "text",
+                                "text": prompt,
+                            },
+                            {
+                                "type": "image_url",
+                                "image_url": {
+                                    "url": image_url,
+                                },
+                            },
+                        ],
+                    }
+                ],
+            )
+        scheduler.observe_headers(model, raw_response.headers)
+        response = raw_response.parse()
+    except RateLimitError as e:
+        scheduler.rate_limited(model, e.response.headers)
+        raise  # retried by backoff
     except OpenAIError as e:
         raise OpenAIError(f"OpenAI API error: {e}") from e
 
@@ -208,11 +398,7 @@ async def describe_image_prompt(prompt: str, image_url: str, model: str) -> str:
 # processing the images
 async def process_image(image_file: str, model: str):
     
-    api_key = config.get("OPENAI_API_KEY")
-    if not api_key:
-        raise ValueError("OPENAI_API_KEY environment variable not found or empty.")
-    
-    client = AsyncOpenAI(api_key=api_key)
+    client = get_client()
     
     print(model)
     
@@ -0,0 +1,115 @@
+import os
+import sqlite3
+import threading
+import time
+from typing import Optional
+
+from utils.metrics import registry
+
+cache_requests = registry.counter("llm_cache_requests_total", "Lookups in the LLM response cache by result (hit, miss, expired)")
+cache_evictions = registry.counter("llm_cache_evictions_total", "Entries evicted from the LLM response cache to stay within its size bound")
+
+
+class LLMCache:
+    """
+    Persistent cache of LLM responses in a SQLite file.
+
+    Entries are keyed by a content hash of the request (see utils.singleflight.request_key),
+    expire `ttl` seconds after they were written (LLM_CACHE_TTL) and are evicted least
+    recently used first once the stored responses exceed `max_bytes` (LLM_CACHE_MAX_MB).
+    Values are strings; callers serialise their own responses.
+    """
+
+    def __init__(self, path: Optional[str] = None, ttl: Optional[float] = None, max_bytes: Optional[int] = None):
+        self.path = path or os.getenv("LLM_CACHE_PATH", "./.cache/llm_cache.sqlite3")
+        self.ttl = ttl if ttl is not None else float(os.getenv("LLM_CACHE_TTL", "86400"))
+        self.max_bytes = max_bytes if max_bytes is not None else int(float(os.getenv("LLM_CACHE_MAX_MB", "50")) * 1024 * 1024)
+        if self.path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        self.db = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL, created REAL NOT NULL, accessed REAL NOT NULL)"
+        )
+        self.db.execute("CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed)")
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str) -> Optional[str]:
+        now = time.time()
+        with self.lock:
+            row = self.db.execute("SELECT value, created FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                cache_requests.inc(result="miss")
+                return None
+            value, created = row
+            if self.ttl > 0 and now - created > self.ttl:
+                self.db.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self.misses += 1
+                cache_requests.inc(result="expired")
+                return None
+            self.db.execute("UPDATE responses SET accessed = ? WHERE key = ?", (now, key))
+            self.hits += 1
+            cache_requests.inc(result="hit")
+            return value
+
+    def set(self, key: str, value: str):
+        now = time.time()
+        size = len(value.encode("utf-8"))
+        with self.lock:
+            self.db.execute(
+                "INSERT OR REPLACE INTO responses (key, value, size, created, accessed) VALUES (?, ?, ?, ?, ?)",
+                (key, value, size, now, now),
+            )
+            self._evict()
+
+    def _evict(self):
+        total = self.db.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        evicted = 0
+        for key, size in self.db.execute("SELECT key, size FROM responses ORDER BY accessed").fetchall():
+            if total <= self.max_bytes:
+                break
+            self.db.execute("DELETE FROM responses WHERE key = ?", (key,))
+            total -= size
+            evicted += 1
+        cache_evictions.inc(evicted)
+
+    def clear(self):
+        with self.lock:
+            self.db.execute("DELETE FROM responses")
+
+    def stats(self) -> dict:
+        with self.lock:
+            entries, size = self.db.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+        lookups = self.hits + self.misses
+        return {
+            "entries": entries,
+            "bytes": size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else None,
+        }
+
+    def close(self):
+        self.db.close()
+
+
+_cache: Optional[LLMCache] = None
+
+
+def get_cache() -> LLMCache:
+    """Return the process-wide cache, opening its file on first use."""
+    global _cache
+    if _cache is None:
+        _cache = LLMCache()
+    return _cache
+
+
+def opened_cache() -> Optional[LLMCache]:
+    """The process-wide cache if something already used it, without creating its file."""
+    return _cache
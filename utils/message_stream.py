@@ -0,0 +1,73 @@
+import asyncio
+import os
+import time
+from typing import Optional
+
+import chainlit as cl
+
+from utils.metrics import registry
+
+stream_tokens = registry.counter("ui_stream_tokens_total", "Tokens appended to streamed chat messages")
+stream_updates = registry.counter("ui_stream_updates_total", "Updates emitted to the UI for streamed chat messages")
+
+
+class ThrottledMessageStream:
+    """
+    Streams text into a cl.Message while coalescing updates.
+
+    Tokens passed to `append` are buffered and emitted together at most once every `interval`
+    seconds (MESSAGE_STREAM_INTERVAL_MS, 100 ms by default), so a fast stream of deltas turns
+    into a few socket.io emits instead of one per token. A pending update is always flushed
+    after at most `interval`, and `close` flushes the rest and ends the stream.
+    """
+
+    def __init__(self, message: Optional[cl.Message] = None, interval: Optional[float] = None):
+        self.message = message or cl.Message(content="")
+        self.interval = interval if interval is not None else int(os.getenv("MESSAGE_STREAM_INTERVAL_MS", "100")) / 1000
+        self.pending = []
+        self.last_flush = 0.0
+        self.flush_task = None
+        self.lock = asyncio.Lock()
+        self.closed = False
+
+    async def append(self, text: str):
+        if self.closed or not text:
+            return
+        self.pending.append(text)
+        stream_tokens.inc()
+        wait = self.last_flush + self.interval - time.monotonic()
+        if wait <= 0:
+            await self.flush()
+        elif self.flush_task is None:
+            self.flush_task = asyncio.create_task(self._flush_later(wait))
+
+    async def _flush_later(self, delay: float):
+        await asyncio.sleep(delay)
+        self.flush_task = None
+        await self.flush()
+
+    async def flush(self):
+        async with self.lock:
+            if not self.pending:
+                return
+            token = "".join(self.pending)
+            self.pending = []
+            self.last_flush = time.monotonic()
+            stream_updates.inc()
+            await self.message.stream_token(token)
+
+    async def close(self, content: Optional[str] = None):
+        """
+        Flushes pending text and ends the stream.
+        :param content: final text of the message, replacing what was streamed
+        """
+        if self.closed:
+            return self.message
+        self.closed = True
+        if self.flush_task:
+            self.flush_task.cancel()
+            self.flush_task = None
+        await self.flush()
+        if content is not None:
+            self.message.content = content
+        return await self.message.send()
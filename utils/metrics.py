@@ -0,0 +1,152 @@
+import math
+import threading
+from collections import defaultdict, deque
+from typing import Callable, Dict, Optional, Tuple
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+
+def _label_key(labels: Dict[str, str]) -> LabelKey:
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+def _format_labels(label_key: LabelKey, extra: Optional[Dict[str, str]] = None) -> str:
+    pairs = list(label_key) + list((extra or {}).items())
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{key}="{value}"' for key, value in pairs) + "}"
+
+
+def quantile(sorted_values: list, q: float) -> float:
+    """Nearest-rank quantile of an already sorted list."""
+    if not sorted_values:
+        return math.nan
+    index = min(len(sorted_values) - 1, max(0, math.ceil(q * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+class Counter:
+    type = "counter"
+
+    def __init__(self, name: str, help: str):
+        self.name = name
+        self.help = help
+        self.values: Dict[LabelKey, float] = defaultdict(float)
+
+    def inc(self, amount: float = 1, **labels):
+        self.values[_label_key(labels)] += amount
+
+    def get(self, **labels) -> float:
+        return self.values.get(_label_key(labels), 0)
+
+    def samples(self):
+        for label_key, value in list(self.values.items()):
+            yield self.name, label_key, None, value
+
+
+class Gauge:
+    type = "gauge"
+
+    def __init__(self, name: str, help: str, callback: Optional[Callable[[], float]] = None):
+        self.name = name
+        self.help = help
+        self.callback = callback
+        self.values: Dict[LabelKey, float] = {}
+
+    def set(self, value: float, **labels):
+        self.values[_label_key(labels)] = value
+
+    def get(self, **labels) -> Optional[float]:
+        if self.callback:
+            return self.callback()
+        return self.values.get(_label_key(labels))
+
+    def samples(self):
+        if self.callback:
+            yield self.name, (), None, self.callback()
+            return
+        for label_key, value in list(self.values.items()):
+            yield self.name, label_key, None, value
+
+
+class Histogram:
+    """
+    Latency distribution exported as a summary: p50/p95/p99 over the last `window`
+    observations of each label set, plus the all-time count and sum.
+    """
+
+    type = "summary"
+    quantiles = (0.5, 0.95, 0.99)
+
+    def __init__(self, name: str, help: str, window: int = 1024):
+        self.name = name
+        self.help = help
+        self.window = window
+        self.observations: Dict[LabelKey, deque] = {}
+        self.counts: Dict[LabelKey, int] = defaultdict(int)
+        self.sums: Dict[LabelKey, float] = defaultdict(float)
+
+    def observe(self, value: float, **labels):
+        label_key = _label_key(labels)
+        observations = self.observations.get(label_key)
+        if observations is None:
+            observations = self.observations[label_key] = deque(maxlen=self.window)
+        observations.append(value)
+        self.counts[label_key] += 1
+        self.sums[label_key] += value
+
+    def percentiles(self, **labels) -> Dict[float, float]:
+        values = sorted(self.observations.get(_label_key(labels), ()))
+        return {q: quantile(values, q) for q in self.quantiles}
+
+    def samples(self):
+        for label_key, observations in list(self.observations.items()):
+            values = sorted(observations)
+            for q in self.quantiles:
+                yield self.name, label_key, {"quantile": str(q)}, quantile(values, q)
+            yield f"{self.name}_sum", label_key, None, self.sums[label_key]
+            yield f"{self.name}_count", label_key, None, self.counts[label_key]
+
+
+class MetricsRegistry:
+    """In-process metrics with a Prometheus-style text exposition."""
+
+    def __init__(self):
+        self.metrics = {}
+        self._lock = threading.Lock()
+
+    def _get_or_create(self, cls, name: str, help: str, **kwargs):
+        with self._lock:
+            metric = self.metrics.get(name)
+            if metric is None:
+                metric = self.metrics[name] = cls(name, help, **kwargs)
+            elif not isinstance(metric, cls):
+                raise ValueError(f"Metric '{name}' is already registered as a {metric.type}")
+            return metric
+
+    def counter(self, name: str, help: str) -> Counter:
+        return self._get_or_create(Counter, name, help)
+
+    def gauge(self, name: str, help: str, callback: Optional[Callable[[], float]] = None) -> Gauge:
+        gauge = self._get_or_create(Gauge, name, help)
+        if callback:
+            gauge.callback = callback
+        return gauge
+
+    def histogram(self, name: str, help: str, window: int = 1024) -> Histogram:
+        return self._get_or_create(Histogram, name, help, window=window)
+
+    def exposition(self) -> str:
+        lines = []
+        for metric in list(self.metrics.values()):
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            for name, label_key, extra, value in metric.samples():
+                if value is None:
+                    continue
+                lines.append(f"{name}{_format_labels(label_key, extra)} {value}")
+        return "\n".join(lines) + "\n"
+
+
+# Process-wide registry, exposed by app.py at /metrics
+registry = MetricsRegistry()
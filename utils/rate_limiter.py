@@ -0,0 +1,236 @@
+import asyncio
+import os
+import re
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from typing import Dict, Mapping, Optional
+
+from chainlit.context import ChainlitContextException, context
+from chainlit.logger import logger
+
+from utils.metrics import registry
+
+scheduler_wait = registry.histogram("llm_scheduler_wait_seconds", "Time LLM calls waited for a concurrency slot and rate-limit budget")
+rate_limited = registry.counter("llm_rate_limited_total", "LLM calls that got a 429 despite the scheduler")
+
+_DURATION = re.compile(r"(\d+(?:\.\d+)?)(ms|s|m|h)")
+_UNITS = {"ms": 0.001, "s": 1, "m": 60, "h": 3600}
+
+
+def parse_reset(value: Optional[str]) -> Optional[float]:
+    """Parses an x-ratelimit-reset-* duration such as "6m0s", "1.5s" or "20ms" into seconds."""
+    if not value:
+        return None
+    parts = _DURATION.findall(value)
+    if not parts:
+        try:
+            return float(value)
+        except ValueError:
+            return None
+    return sum(float(number) * _UNITS[unit] for number, unit in parts)
+
+
+def estimate_tokens(prompt: str, max_output_tokens: int = 1000) -> int:
+    """Rough token cost of a call: ~4 characters per prompt token plus the expected output."""
+    return len(prompt) // 4 + max_output_tokens
+
+
+def current_session_id() -> str:
+    try:
+        return context.session.id
+    except ChainlitContextException:
+        return "default"
+
+
+class TokenBucket:
+    """Budget of `capacity` units per minute, refilled continuously."""
+
+    def __init__(self, capacity: float):
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.capacity / 60)
+        self.updated = now
+
+    def wait_time(self, amount: float) -> float:
+        """Seconds until `amount` units are available; amounts above capacity only need a full bucket."""
+        self._refill()
+        missing = min(amount, self.capacity) - self.tokens
+        return max(missing, 0) * 60 / self.capacity
+
+    def take(self, amount: float):
+        self._refill()
+        self.tokens -= amount
+
+    def give_back(self, amount: float):
+        """Returns units taken for a call that was never made."""
+        self._refill()
+        self.tokens = min(self.capacity, self.tokens + amount)
+
+    def observe(self, limit: Optional[float], remaining: Optional[float], reset_seconds: Optional[float]):
+        """Aligns the bucket with the limits the server reported."""
+        self._refill()
+        if limit:
+            self.capacity = limit
+        if remaining is not None:
+            self.tokens = min(self.tokens, remaining)
+            if remaining <= 0 and reset_seconds:
+                # empty until the server says it resets
+                self.tokens = -reset_seconds * self.capacity / 60
+
+
+class LLMScheduler:
+    """
+    Process-wide pacing of outbound LLM calls.
+
+    Each call first waits until the model's request and token buckets (LLM_DEFAULT_RPM and
+    LLM_DEFAULT_TPM until the server reports its own limits) can pay for it, and then for one of
+    `max_concurrency` slots (LLM_MAX_CONCURRENCY). Calls pay for their budget strictly in arrival
+    order per model, so small calls cannot keep overtaking a large one, and slots are handed
+    out round-robin across Chainlit sessions, so one busy session cannot starve the others.
+    Calls waiting for a rate-limited model hold no slot, so they do not hold up calls to other
+    models, and a call cancelled before it got a slot gives its budget back. The buckets follow
+    the x-ratelimit-* response headers, so calls slow down before the API starts answering 429.
+    """
+
+    def __init__(self, max_concurrency: Optional[int] = None, default_rpm: Optional[float] = None, default_tpm: Optional[float] = None):
+        self.max_concurrency = max_concurrency or int(os.getenv("LLM_MAX_CONCURRENCY", "8"))
+        self.default_rpm = default_rpm or float(os.getenv("LLM_DEFAULT_RPM", "500"))
+        self.default_tpm = default_tpm or float(os.getenv("LLM_DEFAULT_TPM", "200000"))
+        self.requests: Dict[str, TokenBucket] = {}
+        self.tokens: Dict[str, TokenBucket] = {}
+        self.active = 0
+        self.waiting: "OrderedDict[str, deque]" = OrderedDict()  # session id -> futures, in round-robin order
+        self.budget_waiters: Dict[str, deque] = {}  # model -> futures of calls waiting for budget, in arrival order
+        registry.gauge("llm_scheduler_active", "LLM calls in flight", callback=lambda: self.active)
+        registry.gauge("llm_scheduler_queued", "LLM calls waiting for a slot", callback=lambda: sum(len(queue) for queue in self.waiting.values()))
+        registry.gauge("llm_scheduler_budget_queued", "LLM calls waiting for rate-limit budget", callback=self._budget_queued)
+
+    def _buckets(self, model: str):
+        if model not in self.requests:
+            self.requests[model] = TokenBucket(self.default_rpm)
+            self.tokens[model] = TokenBucket(self.default_tpm)
+        return self.requests[model], self.tokens[model]
+
+    async def _acquire_slot(self, session_id: str):
+        if self.active < self.max_concurrency and not self.waiting:
+            self.active += 1
+            return
+        future = asyncio.get_running_loop().create_future()
+        self.waiting.setdefault(session_id, deque()).append(future)
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                self._release_slot()  # granted while being cancelled
+            else:
+                queue = self.waiting.get(session_id)
+                if queue and future in queue:
+                    queue.remove(future)
+                    if not queue:
+                        del self.waiting[session_id]
+            raise
+
+    def _release_slot(self):
+        self.active -= 1
+        while self.waiting and self.active < self.max_concurrency:
+            session_id, queue = next(iter(self.waiting.items()))
+            future = queue.popleft()
+            if queue:
+                self.waiting.move_to_end(session_id)  # next call of this session goes to the back
+            else:
+                del self.waiting[session_id]
+            if not future.done():
+                self.active += 1
+                future.set_result(None)
+
+    def _budget_queued(self) -> int:
+        return sum(len(queue) for queue in self.budget_waiters.values())
+
+    async def _wait_for_budget(self, model: str, estimated_tokens: int):
+        """Pays for a call once every earlier call to the model has paid; only the head of the queue sleeps."""
+        requests, tokens = self._buckets(model)
+        queue = self.budget_waiters.setdefault(model, deque())
+        turn = asyncio.get_running_loop().create_future()
+        queue.append(turn)
+        if len(queue) == 1:
+            turn.set_result(None)
+        try:
+            await turn
+            while True:
+                wait = max(requests.wait_time(1), tokens.wait_time(estimated_tokens))
+                if wait <= 0:
+                    break
+                await asyncio.sleep(wait)
+            requests.take(1)
+            tokens.take(estimated_tokens)
+        finally:
+            # paid or cancelled, either way the next call in line is up
+            queue.remove(turn)
+            if queue and not queue[0].done():
+                queue[0].set_result(None)
+
+    def _refund(self, model: str, estimated_tokens: int):
+        requests, tokens = self._buckets(model)
+        requests.give_back(1)
+        tokens.give_back(estimated_tokens)
+
+    @asynccontextmanager
+    async def slot(self, model: str, estimated_tokens: int, session_id: Optional[str] = None):
+        """
+        Holds a concurrency slot and rate-limit budget for one call.
+        :param model: model id, each has its own buckets
+        :param estimated_tokens: prompt plus expected output tokens, see estimate_tokens
+        :param session_id: fairness key, defaults to the current Chainlit session
+        """
+        started = time.perf_counter()
+        await self._wait_for_budget(model, estimated_tokens)
+        try:
+            await self._acquire_slot(session_id or current_session_id())
+        except asyncio.CancelledError:
+            self._refund(model, estimated_tokens)
+            raise
+        try:
+            scheduler_wait.observe(time.perf_counter() - started, model=model)
+            yield
+        finally:
+            self._release_slot()
+
+    def observe_headers(self, model: str, headers: Mapping[str, str]):
+        """Updates the model's buckets from x-ratelimit-* response headers."""
+        requests, tokens = self._buckets(model)
+        for bucket, kind in ((requests, "requests"), (tokens, "tokens")):
+            limit = headers.get(f"x-ratelimit-limit-{kind}")
+            remaining = headers.get(f"x-ratelimit-remaining-{kind}")
+            bucket.observe(
+                float(limit) if limit else None,
+                float(remaining) if remaining else None,
+                parse_reset(headers.get(f"x-ratelimit-reset-{kind}")),
+            )
+
+    def rate_limited(self, model: str, headers: Mapping[str, str]):
+        """Records a 429 and empties the model's buckets until the reported reset."""
+        rate_limited.inc(model=model)
+        requests, tokens = self._buckets(model)
+        retry_after = parse_reset(headers.get("retry-after")) or 1.0
+        for bucket in (requests, tokens):
+            bucket.observe(None, 0, retry_after)
+        logger.warning(f"LLM rate limit hit for {model}, pausing calls for {retry_after:.1f}s")
+
+    def stats(self) -> dict:
+        return {
+            "active": self.active,
+            "queued": sum(len(queue) for queue in self.waiting.values()),
+            "budget_queued": self._budget_queued(),
+            "models": {
+                model: {"requests_available": round(self.requests[model].tokens), "tokens_available": round(self.tokens[model].tokens)}
+                for model in self.requests
+            },
+        }
+
+
+scheduler = LLMScheduler()
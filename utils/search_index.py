@@ -0,0 +1,189 @@
+import hashlib
+import math
+import os
+import sqlite3
+import threading
+from collections import Counter
+from typing import List, Optional
+
+from chainlit.logger import logger
+
+from utils.file_matcher import tokenize
+from utils.metrics import registry
+
+files_indexed = registry.counter("search_index_files_total", "Scratchpad files checked by the search index by result (indexed, unchanged, removed)")
+search_seconds = registry.histogram("search_index_query_seconds", "Time to answer a search_files query, including the incremental sync")
+
+BINARY_SNIFF_BYTES = 1024
+SNIPPET_CHARS = 200
+
+
+class SearchIndex:
+    """
+    Persistent BM25 index over the files of a directory, in a SQLite file.
+
+    Files are reindexed only when their mtime or size changed and then only if their content
+    hash did too, so keeping the index current costs a stat per file. The file tools call
+    `update`/`remove` when they write; `search` syncs the directory first to pick up changes
+    made outside the tools. Files are identified by name, like the file tools do.
+    """
+
+    k1 = 1.2
+    b = 0.75
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path or os.getenv("SCRATCH_PAD_INDEX_PATH", "./.cache/scratchpad_index.sqlite3")
+        if self.path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        self.db = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS documents ("
+            "name TEXT PRIMARY KEY, mtime REAL NOT NULL, size INTEGER NOT NULL, hash TEXT NOT NULL, length INTEGER NOT NULL)"
+        )
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS postings ("
+            "term TEXT NOT NULL, name TEXT NOT NULL, tf INTEGER NOT NULL, PRIMARY KEY (term, name)) WITHOUT ROWID"
+        )
+        self.db.execute("CREATE INDEX IF NOT EXISTS postings_name ON postings (name)")
+        self.lock = threading.Lock()
+
+    def update(self, directory: str, name: str) -> bool:
+        """Reindexes one file if it changed. Returns True if its postings were rewritten."""
+        file_path = os.path.join(directory, name)
+        try:
+            stat = os.stat(file_path)
+        except FileNotFoundError:
+            self.remove(name)
+            return False
+        with self.lock:
+            row = self.db.execute("SELECT mtime, size, hash FROM documents WHERE name = ?", (name,)).fetchone()
+        if row and row[0] == stat.st_mtime and row[1] == stat.st_size:
+            files_indexed.inc(result="unchanged")
+            return False
+        with open(file_path, "rb") as f:
+            data = f.read()
+        digest = hashlib.sha256(data).hexdigest()
+        with self.lock:
+            if row and row[2] == digest:
+                self.db.execute("UPDATE documents SET mtime = ?, size = ? WHERE name = ?", (stat.st_mtime, stat.st_size, name))
+                files_indexed.inc(result="unchanged")
+                return False
+            # binary files are kept as empty documents so they are not re-read on every sync
+            text = "" if b"\0" in data[:BINARY_SNIFF_BYTES] else data.decode("utf-8", errors="replace")
+            terms = Counter(tokenize(text))
+            self.db.execute("BEGIN")
+            try:
+                self.db.execute("DELETE FROM postings WHERE name = ?", (name,))
+                self.db.executemany("INSERT INTO postings (term, name, tf) VALUES (?, ?, ?)", ((term, name, tf) for term, tf in terms.items()))
+                self.db.execute(
+                    "INSERT OR REPLACE INTO documents (name, mtime, size, hash, length) VALUES (?, ?, ?, ?, ?)",
+                    (name, stat.st_mtime, stat.st_size, digest, sum(terms.values())),
+                )
+                self.db.execute("COMMIT")
+            except BaseException:
+                self.db.execute("ROLLBACK")
+                raise
+        files_indexed.inc(result="indexed")
+        return True
+
+    def remove(self, name: str):
+        with self.lock:
+            if self.db.execute("SELECT 1 FROM documents WHERE name = ?", (name,)).fetchone() is None:
+                return
+            self.db.execute("BEGIN")
+            self.db.execute("DELETE FROM postings WHERE name = ?", (name,))
+            self.db.execute("DELETE FROM documents WHERE name = ?", (name,))
+            self.db.execute("COMMIT")
+        files_indexed.inc(result="removed")
+
+    def sync(self, directory: str):
+        """Brings the index in line with the directory: new and changed files are indexed, missing ones dropped."""
+        names = {name for name in os.listdir(directory) if os.path.isfile(os.path.join(directory, name)) and not name.endswith(".partial")}
+        with self.lock:
+            indexed = {row[0] for row in self.db.execute("SELECT name FROM documents")}
+        for name in indexed - names:
+            self.remove(name)
+        for name in sorted(names):
+            try:
+                self.update(directory, name)
+            except OSError as e:
+                logger.warning(f"Could not index {name}: {e}")
+
+    def search(self, directory: str, query: str, limit: int = 5, snippets: int = 3) -> List[dict]:
+        """
+        Ranks the directory's files against the query with BM25.
+        Returns up to `limit` results with the best matching lines of each file as snippets.
+        """
+        self.sync(directory)
+        terms = set(tokenize(query))
+        if not terms:
+            return []
+        with self.lock:
+            documents, total_length = self.db.execute("SELECT COUNT(*), COALESCE(SUM(length), 0) FROM documents").fetchone()
+            if not documents:
+                return []
+            average_length = total_length / documents or 1
+            placeholders = ",".join("?" * len(terms))
+            postings = self.db.execute(
+                f"SELECT p.term, p.name, p.tf, d.length FROM postings p JOIN documents d ON d.name = p.name WHERE p.term IN ({placeholders})",
+                tuple(terms),
+            ).fetchall()
+        document_frequency = Counter(term for term, _, _, _ in postings)
+        idf = {term: math.log(1 + (documents - df + 0.5) / (df + 0.5)) for term, df in document_frequency.items()}
+        scores = Counter()
+        for term, name, tf, length in postings:
+            norm = tf + self.k1 * (1 - self.b + self.b * length / average_length)
+            scores[name] += idf[term] * tf * (self.k1 + 1) / norm
+        return [
+            {"file": name, "score": round(score, 3), "snippets": self.snippets(directory, name, idf, snippets)}
+            for name, score in scores.most_common(limit)
+        ]
+
+    def snippets(self, directory: str, name: str, idf: dict, count: int) -> List[dict]:
+        """The `count` lines of a file that cover the most (and rarest) query terms, in file order."""
+        scored = []
+        try:
+            with open(os.path.join(directory, name), "r", errors="replace") as f:
+                for number, line in enumerate(f, start=1):
+                    score = sum(idf.get(term, 0) for term in set(tokenize(line)))
+                    if score > 0:
+                        scored.append((score, number, line.strip()[:SNIPPET_CHARS]))
+        except OSError:
+            return []
+        best = sorted(scored, key=lambda entry: (-entry[0], entry[1]))[:count]
+        return [{"line": number, "text": text} for _, number, text in sorted(best, key=lambda entry: entry[1])]
+
+    def stats(self) -> dict:
+        with self.lock:
+            documents, terms = self.db.execute("SELECT (SELECT COUNT(*) FROM documents), (SELECT COUNT(*) FROM postings)").fetchone()
+        return {"files": documents, "postings": terms}
+
+    def close(self):
+        self.db.close()
+
+
+_index: Optional[SearchIndex] = None
+
+
+def get_index() -> SearchIndex:
+    """Return the process-wide scratchpad index, opening its file on first use."""
+    global _index
+    if _index is None:
+        _index = SearchIndex()
+    return _index
+
+
+def index_file(directory: str, name: str):
+    """Reindexes a file the tools just wrote; indexing problems never fail the tool."""
+    try:
+        get_index().update(directory, name)
+    except Exception as e:
+        logger.warning(f"Could not index {name}: {e}")
+
+
+def unindex_file(name: str):
+    try:
+        get_index().remove(name)
+    except Exception as e:
+        logger.warning(f"Could not remove {name} from the index: {e}")
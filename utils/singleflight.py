@@ -0,0 +1,52 @@
+import asyncio
+import hashlib
+import json
+from typing import Any, Awaitable, Callable, Dict
+
+from pydantic import BaseModel
+
+from utils.metrics import registry
+
+singleflight_calls = registry.counter("llm_singleflight_calls_total", "Calls through single-flight groups; role=follower calls shared another call's request")
+
+
+def request_key(*parts: Any) -> str:
+    """Stable hash of the parts identifying a request (prompt, model, schema, ...)."""
+    return hashlib.sha256(json.dumps(parts, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+
+class SingleFlight:
+    """
+    Coalesces identical concurrent calls into one.
+
+    The first caller for a key starts the call as a task; callers arriving while it is in
+    flight await the same task instead of issuing their own request, and get a copy of a
+    pydantic result so they cannot mutate each other's. The task is shielded, so a caller
+    being cancelled does not cancel the request for the others. Keys are forgotten as soon
+    as the call finishes: this is not a cache.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.calls: Dict[str, asyncio.Future] = {}
+
+    async def do(self, key: str, call: Callable[[], Awaitable[Any]]) -> Any:
+        task = self.calls.get(key)
+        if task is not None:
+            singleflight_calls.inc(function=self.name, role="follower")
+            result = await asyncio.shield(task)
+            return result.model_copy(deep=True) if isinstance(result, BaseModel) else result
+        singleflight_calls.inc(function=self.name, role="leader")
+        task = asyncio.ensure_future(call())
+        self.calls[key] = task
+        task.add_done_callback(lambda done: self._forget(key, done))
+        return await asyncio.shield(task)
+
+    def _forget(self, key: str, task: asyncio.Future):
+        if self.calls.get(key) is task:
+            del self.calls[key]
+        if not task.cancelled():
+            task.exception()  # mark retrieved when every caller has gone away
+
+    def in_flight(self) -> int:
+        return len(self.calls)